@@ -0,0 +1,109 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+import typer
+from src.depgraph import (
+    DependencyGraph,
+    TitleMatcher,
+    critical_path,
+    dependencies_section,
+    topological_batches,
+)
+from src.genai import UserStory
+
+app = typer.Typer(help="Dependency queries from the graph index vs parsing the stories")
+
+
+def parse_all(stories_dir: str) -> dict[str, set[str]]:
+    """Reads and parses every story file, as a planning view had to before the index."""
+    texts = {}
+    for filename in os.listdir(stories_dir):
+        with open(os.path.join(stories_dir, filename), "r", encoding="utf-8") as f:
+            content = f.read()
+        texts[content.splitlines()[0].removeprefix("# ")] = dependencies_section(
+            content
+        )
+    matcher = TitleMatcher(texts)
+    return {title: matcher.find(text) - {title} for title, text in texts.items()}
+
+
+def timed(fn, repeat: int) -> float:
+    """Returns the median time of fn in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+@app.command()
+def main(
+    stories: int = typer.Option(2000, help="Number of stories"),
+    max_dependencies: int = typer.Option(3, help="Maximum dependencies per story"),
+    repeat: int = typer.Option(5, help="Repetitions of each measure"),
+):
+    """Builds a random dependency DAG, then times the dependency queries both ways."""
+    rng = random.Random(0)
+    data_dir = tempfile.mkdtemp()
+    stories_dir = os.path.join(data_dir, "stories")
+    os.makedirs(stories_dir)
+    base_path = os.path.join(data_dir, "stories_graph")
+    graph = DependencyGraph(base_path)
+    titles = [f"Story {i}" for i in range(stories)]
+
+    start = time.perf_counter()
+    for i, title in enumerate(titles):
+        # Depending only on earlier stories keeps the graph acyclic
+        deps = rng.sample(titles[:i], min(i, rng.randint(0, max_dependencies)))
+        story = UserStory(
+            Title=title,
+            Description="A story.",
+            AcceptanceCriteria="- It works.",
+            Dependencies=", ".join(deps),
+        )
+        with open(os.path.join(stories_dir, f"{i}.md"), "w", encoding="utf-8") as f:
+            f.write(story.to_template_string())
+        graph.set(title, story.Dependencies)
+    build = time.perf_counter() - start
+    typer.echo(f"incremental index update: {build / stories * 1000:.2f} ms per story")
+
+    def plan_from_files():
+        requires = parse_all(stories_dir)
+        batches, _ = topological_batches(requires)
+        critical_path(requires, [t for batch in batches for t in batch])
+
+    def plan_from_index():
+        graph._plan = None
+        graph.plan()
+
+    title = titles[stories // 2]
+    results = [
+        ("plan, parsing the stories", timed(plan_from_files, repeat)),
+        ("plan, from the index", timed(plan_from_index, repeat)),
+        ("plan, cached", timed(graph.plan, repeat)),
+        (
+            "story context, parsing",
+            timed(lambda: parse_all(stories_dir)[title], repeat),
+        ),
+        (
+            "story context, from the index",
+            timed(lambda: (graph.dependencies(title), graph.dependents(title)), repeat),
+        ),
+        (
+            "reload the index",
+            timed(lambda: DependencyGraph(base_path), repeat),
+        ),
+    ]
+    for name, elapsed in results:
+        typer.echo(f"{name:<32}{elapsed:>10.3f} ms")
+    plan = graph.plan()
+    typer.echo(
+        f"{len(plan['batches'])} batches, critical path of {len(plan['critical_path'])} stories"
+    )
+
+
+if __name__ == "__main__":
+    app()
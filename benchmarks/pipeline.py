@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import logging
+import typer
+
+# Keep the benchmark away from the real stories DB
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
+
+from src.agent import refine_stories_in_batches, refine_stories_pipelined  # noqa: E402
+from src.config import PipelineStage  # noqa: E402
+from src.fake_llm import FakeStoryChatModel  # noqa: E402
+from src.genai import get_stories_minimal, refine_stories  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+app = typer.Typer(
+    help="Sequential, dependency batches and pipelined extraction and refinement latency"
+)
+
+
+def make_document(stories: int) -> str:
+    """Returns a problem description the fake model turns into the given number of stories."""
+    return "\n".join(
+        f"Users of area {i} can manage their records and export reports"
+        for i in range(stories)
+    )
+
+
+@app.command()
+def main(
+    stories: int = typer.Option(10, help="Number of stories in the document"),
+    first_token_latency: float = typer.Option(0.2, help="Fake time to first token (s)"),
+    chunk_latency: float = typer.Option(0.01, help="Fake delay per streamed chunk (s)"),
+    workers: int = typer.Option(4, help="Concurrent refinement workers"),
+):
+    """Measures the end-to-end latency of extraction plus refinement with the fake model."""
+    llm = FakeStoryChatModel(
+        first_token_latency=first_token_latency, chunk_latency=chunk_latency
+    )
+    problem_text = make_document(stories)
+
+    start = time.perf_counter()
+    refine_stories(llm, get_stories_minimal(llm, problem_text))
+    sequential = time.perf_counter() - start
+
+    results = {"sequential": sequential}
+    state = {
+        "stories_minimal": [],
+        "llms": {PipelineStage.EXTRACT: llm, PipelineStage.REFINE: llm},
+        "fallback_llm": None,
+    }
+    start = time.perf_counter()
+    state["stories_minimal"] = get_stories_minimal(llm, problem_text)
+    refine_stories_in_batches(state, workers=workers)
+    results[f"batches ({workers} workers)"] = time.perf_counter() - start
+
+    for n in sorted({1, workers}):
+        state = {
+            "problem_text": problem_text,
+            "stories_minimal": [],
+            "llms": {PipelineStage.EXTRACT: llm, PipelineStage.REFINE: llm},
+            "fallback_llm": None,
+        }
+        start = time.perf_counter()
+        refine_stories_pipelined(state, workers=n)
+        results[f"pipelined ({n} workers)"] = time.perf_counter() - start
+
+    for name, elapsed in results.items():
+        reduction = (1 - elapsed / sequential) * 100
+        logging.info(f"{name:<24} {elapsed:8.3f}s  ({reduction:5.1f}% reduction)")
+
+
+if __name__ == "__main__":
+    app()
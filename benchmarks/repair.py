@@ -0,0 +1,67 @@
+import os
+import tempfile
+import logging
+import typer
+
+# Keep the benchmark away from the real stories DB
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
+
+import src.genai  # noqa: E402
+from src.fake_llm import FakeStoryChatModel  # noqa: E402
+from src.genai import (  # noqa: E402
+    UserStoryMinimal,
+    format_structured_output_stats,
+    get_stories_minimal,
+    get_structured_output_stats,
+    refine_story,
+)
+from benchmarks.pipeline import make_document  # noqa: E402
+
+logging.getLogger().setLevel(logging.ERROR)
+
+app = typer.Typer(help="Local repair of malformed structured output")
+
+
+def run(llm: FakeStoryChatModel, calls: int) -> dict[str, int]:
+    before = get_structured_output_stats()
+    for i in range(calls):
+        try:
+            if i % 2:
+                get_stories_minimal(llm, make_document(5))
+            else:
+                refine_story(
+                    llm, UserStoryMinimal(Title=f"Story {i}", Description="Manage")
+                )
+        except Exception:
+            pass
+    after = get_structured_output_stats()
+    return {key: after[key] - before[key] for key in after}
+
+
+@app.command()
+def main(
+    calls: int = typer.Option(200, help="Structured output calls per run"),
+    malformed_rate: float = typer.Option(0.3, help="Share of malformed answers"),
+):
+    """Compares the model round trips with and without the local repair."""
+    results = {}
+    for name, repair in [("retry only", False), ("repair, then retry", True)]:
+        llm = FakeStoryChatModel(
+            first_token_latency=0, chunk_latency=0, malformed_rate=malformed_rate
+        )
+        original = src.genai.repair_structured_output
+        if not repair:
+            src.genai.repair_structured_output = lambda raw, schema: None
+        try:
+            results[name] = run(llm, calls)
+        finally:
+            src.genai.repair_structured_output = original
+
+    for name, stats in results.items():
+        round_trips = stats["calls"] + stats["retried"]
+        typer.echo(f"{name}: {round_trips} model round trips")
+        typer.echo(f"  {format_structured_output_stats(stats)}")
+
+
+if __name__ == "__main__":
+    app()
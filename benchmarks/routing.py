@@ -0,0 +1,103 @@
+import os
+import tempfile
+import logging
+import typer
+
+# Keep the benchmark away from the real stories DB
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
+
+from src.agent import State, format_stage_reports, run_pipeline  # noqa: E402
+from src.config import PipelineStage  # noqa: E402
+from src.fake_llm import FakeStoryChatModel  # noqa: E402
+from src.genai import get_structured_output_stats, story_quality_issues  # noqa: E402
+from benchmarks.pipeline import make_document  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+app = typer.Typer(help="Latency and cost of per-stage model routing and cascading")
+
+# Fake latency profiles: (time to first token, delay per chunk, failure rate)
+PROFILES = {
+    "gemma-3:8b": (0.05, 0.002, 0.3),
+    "gemini-2.5-flash-lite": (0.3, 0.001, 0.0),
+    "gemini-2.5-flash": (0.6, 0.003, 0.0),
+    "gemini-2.5-pro": (1.5, 0.008, 0.0),
+}
+
+# Routing choices: (clean, extract, refine, cascade)
+ROUTES = {
+    "pro everywhere": ("gemini-2.5-pro",) * 3 + (None,),
+    "flash-lite everywhere": ("gemini-2.5-flash-lite",) * 3 + (None,),
+    "lite/flash/pro per stage": (
+        "gemini-2.5-flash-lite",
+        "gemini-2.5-flash",
+        "gemini-2.5-pro",
+        None,
+    ),
+    "local only": ("gemma-3:8b",) * 3 + (None,),
+    "local, cascade to pro": ("gemma-3:8b",) * 3 + ("gemini-2.5-pro",),
+}
+
+
+def fake_model(name: str) -> FakeStoryChatModel:
+    first_token_latency, chunk_latency, failure_rate = PROFILES[name]
+    return FakeStoryChatModel(
+        model=name,
+        first_token_latency=first_token_latency,
+        chunk_latency=chunk_latency,
+        failure_rate=failure_rate,
+    )
+
+
+def make_state(route: tuple, problem_text: str) -> State:
+    clean, extract, refine, cascade = route
+    return {
+        "orig_problem_text": problem_text,
+        "problem_text": "",
+        "stories_minimal": [],
+        "stories": [],
+        "llms": {
+            PipelineStage.CLEAN: fake_model(clean),
+            PipelineStage.EXTRACT: fake_model(extract),
+            PipelineStage.REFINE: fake_model(refine),
+        },
+        "fallback_llm": fake_model(cascade) if cascade else None,
+        "reports": [],
+    }
+
+
+@app.command()
+def main(stories: int = typer.Option(8, help="Number of stories in the document")):
+    """Runs the pipeline with each routing choice on the offline fake models."""
+    problem_text = make_document(stories)
+    summary = []
+    for name, route in ROUTES.items():
+        before = get_structured_output_stats()["escalations"]
+        state = make_state(route, problem_text)
+        try:
+            run_pipeline(state, minimal=False)
+        except Exception as e:
+            logging.info(f"\n{name}: failed ({type(e).__name__})")
+            summary.append((name, None, None, None, None))
+            continue
+        logging.info(f"\n{name}\n{format_stage_reports(state['reports'])}")
+        rejected = sum(1 for s in state["stories"] if story_quality_issues(s))
+        escalations = get_structured_output_stats()["escalations"] - before
+        latency = sum(r["latency"] for r in state["reports"])
+        cost = sum(r["cost"] for r in state["reports"])
+        summary.append((name, latency, cost, escalations, rejected))
+
+    logging.info(
+        f"\n{'routing':<26}{'latency':>9}{'cost $':>11}{'escal.':>8}{'poor':>6}"
+    )
+    for name, latency, cost, escalations, rejected in summary:
+        if latency is None:
+            logging.info(f"{name:<26}{'failed':>9}")
+            continue
+        logging.info(
+            f"{name:<26}{latency:>8.2f}s{cost:>11.6f}{escalations:>8}{rejected:>6}"
+        )
+
+
+if __name__ == "__main__":
+    app()
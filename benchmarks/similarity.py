@@ -0,0 +1,82 @@
+import random
+import statistics
+import tempfile
+import time
+import os
+import typer
+from src.similarity import INDEX_DIM, SimilarityIndex
+
+app = typer.Typer(help="Build and query times of the related stories index")
+
+
+def make_story(rng: random.Random, vocabulary: list[str], topic: list[str]) -> str:
+    """Draws half of the words from the vocabulary of the story topic."""
+    words = " ".join(rng.choices(vocabulary, k=20) + rng.choices(topic, k=20))
+    return (
+        f"# Story\n\n## Description\n{words}\n\n"
+        "## Acceptance Criteria\n- It works.\n\nDependencies: \n\nPriority: "
+    )
+
+
+@app.command()
+def main(
+    stories: int = typer.Option(50_000, help="Number of stories in the index"),
+    queries: int = typer.Option(1000, help="Number of related stories queries"),
+    words: int = typer.Option(20_000, help="Size of the vocabulary"),
+    topics: int = typer.Option(200, help="Number of topics splitting the vocabulary"),
+    dim: int = typer.Option(INDEX_DIM, help="Dimension of the hashed term space"),
+):
+    """
+    Builds the index incrementally, then times the top-k queries and the reload.
+
+    The quality is the share of the top-10 related stories sharing the topic
+    of the queried story, which hash collisions between words lower.
+    """
+    rng = random.Random(0)
+    vocabulary = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=7)) for _ in range(words)
+    ]
+    size = words // topics
+    vocabularies = [vocabulary[i * size : (i + 1) * size] for i in range(topics)]
+    topic_of = {}
+    base_path = os.path.join(tempfile.mkdtemp(), "stories_index")
+    index = SimilarityIndex(base_path, dim)
+
+    def story(i: int) -> str:
+        topic_of[f"Story {i}"] = topic = rng.randrange(topics)
+        return make_story(rng, vocabulary, vocabularies[topic])
+
+    start = time.perf_counter()
+    for i in range(stories):
+        index.add(f"Story {i}", story(i))
+    build = time.perf_counter() - start
+    typer.echo(f"incremental add: {build / stories * 1000:.3f} ms per story")
+
+    start = time.perf_counter()
+    index.query("Story 0")
+    typer.echo(f"first query (weights): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    latencies = []
+    same_topic = []
+    for _ in range(queries):
+        title = f"Story {rng.randrange(stories)}"
+        start = time.perf_counter()
+        related = index.query(title, k=10)
+        latencies.append(time.perf_counter() - start)
+        same_topic += [topic_of[other] == topic_of[title] for other, _ in related]
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    typer.echo(f"top-10 query: p50 {q[49] * 1000:.2f} ms, p99 {q[98] * 1000:.2f} ms")
+    typer.echo(f"top-10 same topic: {statistics.mean(same_topic):.1%}")
+
+    start = time.perf_counter()
+    index.add("Story 0", story(0))
+    index.query("Story 0")
+    typer.echo(f"edit then query: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    SimilarityIndex(base_path, dim)
+    typer.echo(f"reload from disk: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    app()
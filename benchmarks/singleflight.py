@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import typer
+
+# Keep the benchmark away from the real stories DB
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
+
+from src import agent  # noqa: E402
+from src.fake_llm import FakeStoryChatModel  # noqa: E402
+from src.genai import get_structured_output_stats  # noqa: E402
+from src.storage import get_story_titles, remove_all_story  # noqa: E402
+
+logging.getLogger().setLevel(logging.ERROR)
+
+app = typer.Typer(help="Duplicate work under bursts of identical creation requests")
+
+
+def burst(create, documents: list[str], copies: int) -> tuple[float, int, int]:
+    """Submits every document `copies` times at once, returns time, LLM calls and saves."""
+    remove_all_story()
+    calls_before = get_structured_output_stats()["calls"]
+    requests = [d for d in documents for _ in range(copies)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        list(executor.map(lambda d: create("ollama", "fake", d, False), requests))
+    elapsed = time.perf_counter() - start
+    calls = get_structured_output_stats()["calls"] - calls_before
+    return elapsed, calls, len(get_story_titles())
+
+
+@app.command()
+def main(
+    documents: int = typer.Option(3, help="Distinct documents in the burst"),
+    copies: int = typer.Option(8, help="Identical requests per document"),
+):
+    """Compares a burst of requests with and without single-flight coalescing."""
+    agent.get_chat_model = lambda provider, model: FakeStoryChatModel(model=model)
+    docs = [
+        f"Team {i} users export reports.\nTeam {i} admins manage users."
+        for i in range(documents)
+    ]
+
+    def uncoalesced(provider, model, problem_text, minimal):
+        return agent._create_stories(
+            provider, model, problem_text, minimal, False, None, None
+        )
+
+    typer.echo(f"{'':<14}{'time':>8}{'structured calls':>18}{'stories saved':>15}")
+    for name, create in [
+        ("uncoalesced", uncoalesced),
+        ("single-flight", agent.create_stories),
+    ]:
+        elapsed, calls, saved = burst(create, docs, copies)
+        typer.echo(f"{name:<14}{elapsed:>7.2f}s{calls:>18}{saved:>15}")
+
+
+if __name__ == "__main__":
+    app()
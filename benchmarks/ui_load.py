@@ -0,0 +1,217 @@
+import io
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import typer
+import streamlit
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import (
+    MemoryCacheStorageManager,
+)
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+
+# Keep the load test away from the real stories DB
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
+
+import src.agent  # noqa: E402
+from src.fake_llm import FakeStoryChatModel  # noqa: E402
+from src.genai import UserStory  # noqa: E402
+from src.storage import remove_all_story, save_story  # noqa: E402
+
+# The UI resets the root log level on every run: silence the pipeline logs
+# at the handler instead, the results are printed with typer.echo
+logging.basicConfig(format="%(message)s")
+logging.getLogger().handlers[0].setLevel(logging.WARNING)
+# Setting the session state from outside a script run warns about the context
+logging.getLogger(
+    "streamlit.runtime.scriptrunner_utils.script_run_context"
+).disabled = True
+
+app = typer.Typer(help="Concurrent-session load test of the Streamlit UI")
+
+UI_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "ui.py"
+)
+# Session state key holding the document the simulated user uploads
+DOCUMENT_KEY = "_load_test_document"
+# Relative weight of each user action in a session
+ACTIONS = {"browse": 4, "view": 3, "edit": 2, "create": 1}
+
+
+def _patch_app_test() -> None:
+    """
+    Makes AppTest usable from several threads at once.
+
+    AppTest installs a mock runtime for each run and removes it at the end,
+    which breaks the runs still in progress in other threads: a shared mock
+    runtime is returned instead. AppTest has no file uploader support, so the
+    uploader returns the document stored in the session state.
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or runtime)
+
+    def file_uploader(*args, **kwargs):
+        document = streamlit.session_state.get(DOCUMENT_KEY)
+        if document is None:
+            return None
+        uploaded = io.BytesIO(document.encode("utf-8"))
+        uploaded.name = "document.txt"
+        return uploaded
+
+    streamlit.file_uploader = file_uploader
+
+
+class Session:
+    """A simulated user session, timing every script run it triggers."""
+
+    def __init__(self, session_id: int, seed: int, timeout: float) -> None:
+        self.session_id = session_id
+        self.random = random.Random(seed)
+        self.at = AppTest.from_file(UI_SCRIPT, default_timeout=timeout)
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.creates = 0
+
+    def _run(self, element=None) -> None:
+        start = time.perf_counter()
+        (element or self.at).run()
+        self.latencies.append(time.perf_counter() - start)
+        if self.at.exception:
+            self.errors += 1
+
+    def _story_titles(self) -> list[str]:
+        return [
+            b.key.removeprefix("view_")
+            for b in self.at.sidebar.button
+            if b.key and b.key.startswith("view_")
+        ]
+
+    def _sidebar_button(self, label: str):
+        return next(b for b in self.at.sidebar.button if b.label == label)
+
+    def _open_random_story(self) -> str | None:
+        titles = self._story_titles()
+        if not titles:
+            return None
+        title = self.random.choice(titles)
+        self._run(self.at.sidebar.button(key=f"view_{title}").click())
+        return title
+
+    def browse(self) -> None:
+        self._run(self._sidebar_button("Create Stories").click())
+        self._open_random_story()
+
+    def view(self) -> None:
+        title = self._open_random_story()
+        if title and self.at.button(key=f"rename_{title}"):
+            self._run(self.at.button(key=f"rename_{title}").click())
+            self._run(self.at.button(key=f"cancel_rename_{title}").click())
+
+    def edit(self) -> None:
+        title = self._open_random_story()
+        if not title:
+            return
+        self._run(self.at.button(key=f"edit_{title}").click())
+        content = self.at.text_area[0].value
+        self._run(self.at.text_area[0].input(f"{content}\n\nEdited."))
+        self._run(self.at.button(key=f"save_{title}").click())
+
+    def create(self) -> None:
+        self.creates += 1
+        self.at.session_state[DOCUMENT_KEY] = (
+            f"Session {self.session_id} request {self.creates} exports reports.\n"
+            f"Session {self.session_id} request {self.creates} manages users."
+        )
+        self._run(self._sidebar_button("Create Stories").click())
+        create = next(b for b in self.at.main.button if b.label == "Create")
+        self._run(create.click())
+        self.at.session_state[DOCUMENT_KEY] = None
+
+    def play(self, actions: int) -> None:
+        self._run()
+        names = list(ACTIONS)
+        weights = list(ACTIONS.values())
+        for _ in range(actions):
+            getattr(self, self.random.choices(names, weights)[0])()
+
+
+def seed_stories(count: int) -> None:
+    remove_all_story()
+    for i in range(count):
+        save_story(
+            UserStory(
+                Title=f"Seed story {i}",
+                Description=f"Users of area {i} can manage their records.",
+                AcceptanceCriteria="- Records can be created, edited and removed.",
+            )
+        )
+
+
+def run_level(concurrency: int, actions: int, timeout: float) -> dict:
+    sessions = [Session(i, seed=i, timeout=timeout) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency)
+
+    def play(session: Session) -> None:
+        barrier.wait()
+        session.play(actions)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(play, sessions))
+    elapsed = time.perf_counter() - start
+
+    latencies = [t for s in sessions for t in s.latencies]
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "sessions": concurrency,
+        "runs": len(latencies),
+        "errors": sum(s.errors for s in sessions),
+        "p50": q[49],
+        "p95": q[94],
+        "p99": q[98],
+        "throughput": len(latencies) / elapsed,
+    }
+
+
+@app.command()
+def main(
+    levels: str = typer.Option("1,2,4,8,16", help="Comma separated concurrency levels"),
+    actions: int = typer.Option(10, help="User actions per session"),
+    stories: int = typer.Option(
+        50, help="Stories in the DB at the start of each level"
+    ),
+    llm_latency: float = typer.Option(0.05, help="Fake model time to first token (s)"),
+    timeout: float = typer.Option(60, help="Timeout of a single script run (s)"),
+):
+    """Drives concurrent simulated sessions and reports the script run latency."""
+    _patch_app_test()
+    src.agent.get_chat_model = lambda provider, model: FakeStoryChatModel(
+        model=model, first_token_latency=llm_latency, chunk_latency=0
+    )
+
+    typer.echo(
+        f"{'sessions':>8}{'runs':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'runs/s':>9}"
+    )
+    for level in [int(n) for n in levels.split(",")]:
+        seed_stories(stories)
+        r = run_level(level, actions, timeout)
+        typer.echo(
+            f"{r['sessions']:>8}{r['runs']:>7}{r['errors']:>8}"
+            f"{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}"
+            f"{r['throughput']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    app()
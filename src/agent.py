@@ -1,25 +1,96 @@
-from typing import TypedDict
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Iterator, TypedDict
+from langchain_core.callbacks import get_usage_metadata_callback
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain.chat_models import init_chat_model
+from src.config import (
+    PipelineStage,
+    check_provider,
+    get_model_cost,
+    parse_model_spec,
+)
+from src.depgraph import resolve_references, topological_batches
 from src.genai import (
     UserStory,
     UserStoryMinimal,
     clean_problem_description,
+    format_structured_output_stats,
     get_stories_minimal,
-    refine_stories,
+    refine_story,
+    stream_stories_minimal,
+    track_structured_output_stats,
 )
+from src.singleflight import SingleFlight, make_key
 from src.storage import save_story, save_problem_description
 
+# Number of stories refined concurrently
+REFINE_WORKERS = 4
+
+# Chat model clients shared by all the pipelines of the process
+_model_pool: dict[tuple[str, str], BaseChatModel] = {}
+_model_pool_lock = threading.Lock()
+
+# Identical story creations running at the same time share a single run
+_creations = SingleFlight()
+
+
+class StageReport(TypedDict):
+    stage: str
+    models: list[str]
+    latency: float
+    input_tokens: int
+    output_tokens: int
+    cost: float
+
 
 class State(TypedDict):
     orig_problem_text: str
     problem_text: str
     stories_minimal: list[UserStoryMinimal]
     stories: list[UserStory]
-    llm: BaseChatModel
+    llms: dict[PipelineStage, BaseChatModel]
+    fallback_llm: BaseChatModel | None
+    reports: list[StageReport]
+
+
+def get_chat_model(provider: str, model: str) -> BaseChatModel:
+    """
+    Returns the chat model for the given provider and model.
+
+    The clients are pooled, so that concurrent pipelines using the same model
+    share its connections instead of each creating its own.
 
+    Args:
+        provider (str): The provider for the language model.
+        model (str): The model to use.
+
+    Returns:
+        BaseChatModel: The chat model.
 
-def get_initial_state(provider: str, model: str, problem_text: str) -> State:
+    Raises:
+        ValueError: If the provider is not a supported ModelProvider.
+    """
+    check_provider(provider)
+    with _model_pool_lock:
+        llm = _model_pool.get((provider, model))
+        if llm is None:
+            llm = init_chat_model(f"{provider}:{model}")
+            _model_pool[(provider, model)] = llm
+        return llm
+
+
+def get_initial_state(
+    provider: str,
+    model: str,
+    problem_text: str,
+    stage_models: dict[PipelineStage, str] | None = None,
+    cascade_model: str | None = None,
+) -> State:
     """
     Returns the initial state for the agent.
 
@@ -27,30 +98,285 @@ def get_initial_state(provider: str, model: str, problem_text: str) -> State:
         provider (str): The provider for the language model.
         model (str): The model to use.
         problem_text (str): The text of the problem description.
+        stage_models (dict | None): "provider:model" overriding the model of some stages.
+        cascade_model (str | None): "provider:model" to escalate to when the
+            structured output of a stage is invalid or rejected.
 
     Returns:
-        State: The initial state containing the document and llm.
+        State: The initial state containing the document and the llms.
     """
-    llm = init_chat_model(f"{provider}:{model}")
+    stage_models = stage_models or {}
+    llms = {}
+    for stage in PipelineStage:
+        if stage in stage_models:
+            llms[stage] = get_chat_model(*parse_model_spec(stage_models[stage]))
+        else:
+            llms[stage] = get_chat_model(provider, model)
+    fallback_llm = None
+    if cascade_model:
+        fallback_llm = get_chat_model(*parse_model_spec(cascade_model))
     return {
         "orig_problem_text": problem_text,
         "problem_text": "",
         "stories_minimal": [],
         "stories": [],
-        "llm": llm,
+        "llms": llms,
+        "fallback_llm": fallback_llm,
+        "reports": [],
     }
 
 
-def create_stories(provider: str, model: str, problem_text: str, minimal: bool) -> None:
-    state = get_initial_state(provider, model, problem_text)
-    state["problem_text"] = clean_problem_description(
-        state["llm"], state["orig_problem_text"]
+@contextmanager
+def measure_stage(state: State, stage: str) -> Iterator[None]:
+    """
+    Records the latency, token usage and cost of a pipeline stage in the state.
+
+    Args:
+        state (State): The agent state where the report is appended.
+        stage (str): The name of the stage.
+    """
+    start = time.perf_counter()
+    with get_usage_metadata_callback() as callback:
+        yield
+    usage = callback.usage_metadata
+    state["reports"].append(
+        {
+            "stage": stage,
+            "models": sorted(usage),
+            "latency": time.perf_counter() - start,
+            "input_tokens": sum(u["input_tokens"] for u in usage.values()),
+            "output_tokens": sum(u["output_tokens"] for u in usage.values()),
+            "cost": sum(
+                get_model_cost(m, u["input_tokens"], u["output_tokens"])
+                for m, u in usage.items()
+            ),
+        }
+    )
+
+
+def format_stage_reports(reports: list[StageReport]) -> str:
+    """Returns the stage reports as a table, with a final total row."""
+    lines = [
+        f"{'stage':<16}{'latency':>10}{'tokens in':>11}{'out':>8}{'cost $':>11}  models"
+    ]
+    for r in reports:
+        lines.append(
+            f"{r['stage']:<16}{r['latency']:>9.2f}s{r['input_tokens']:>11}"
+            f"{r['output_tokens']:>8}{r['cost']:>11.6f}  {', '.join(r['models'])}"
+        )
+    lines.append(
+        f"{'total':<16}{sum(r['latency'] for r in reports):>9.2f}s"
+        f"{sum(r['input_tokens'] for r in reports):>11}"
+        f"{sum(r['output_tokens'] for r in reports):>8}"
+        f"{sum(r['cost'] for r in reports):>11.6f}"
     )
+    return "\n".join(lines)
+
+
+def story_dependencies(stories: list[UserStoryMinimal]) -> dict[int, set[int]]:
+    """
+    Resolves the dependencies of the extracted stories to their positions.
+
+    Args:
+        stories (list[UserStoryMinimal]): The extracted stories.
+
+    Returns:
+        dict[int, set[int]]: The positions of the stories required by each story.
+    """
+    positions = {story.Title: i for i, story in enumerate(stories)}
+    return {
+        i: {
+            positions[title]
+            for title in resolve_references("\n".join(story.Dependencies), positions)
+        }
+        - {i}
+        for i, story in enumerate(stories)
+    }
+
+
+def refine_stories_in_batches(state: State, workers: int = REFINE_WORKERS) -> None:
+    """
+    Refines the extracted stories in dependency order.
+
+    The stories are grouped in batches depending only on the previous ones:
+    the stories of a batch are refined concurrently, each with its refined
+    dependencies as context. Stories in a dependency cycle are refined last.
+
+    Args:
+        state (State): The agent state with the extracted stories.
+        workers (int): The number of concurrent refinement workers.
+    """
+    llms = state["llms"]
+    stories = state["stories_minimal"]
+    requires = story_dependencies(stories)
+    batches, cyclic = topological_batches(requires)
+    if cyclic:
+        logging.warning(
+            f"{len(cyclic)} stories are in a dependency cycle, refining them last."
+        )
+        batches.append(cyclic)
+    refined: dict[int, UserStory] = {}
+
+    def refine(i: int) -> UserStory:
+        return refine_story(
+            llms[PipelineStage.REFINE],
+            stories[i],
+            state["fallback_llm"],
+            [refined[dep] for dep in sorted(requires[i]) if dep in refined],
+        )
+
+    with ContextThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            refined.update(zip(batch, executor.map(refine, batch)))
+    state["stories"] = [refined[i] for i in range(len(stories))]
+
+
+def refine_stories_pipelined(state: State, workers: int = REFINE_WORKERS) -> None:
+    """
+    Extracts and refines the stories with the two stages overlapping.
+
+    Each story is handed to a refinement worker as soon as the streamed
+    extraction output contains it, instead of waiting for the whole list.
+    A story depending on stories streamed before it waits for their
+    refinement, to have them as context; the workers take the stories in
+    stream order, so the ones waited for are already running or done.
+
+    Args:
+        state (State): The agent state with the cleaned problem text.
+        workers (int): The number of concurrent refinement workers.
+    """
+    llms = state["llms"]
+
+    def refine(story: UserStoryMinimal, dependencies: list[Future]) -> UserStory:
+        return refine_story(
+            llms[PipelineStage.REFINE],
+            story,
+            state["fallback_llm"],
+            [future.result() for future in dependencies],
+        )
+
+    with ContextThreadPoolExecutor(max_workers=workers) as executor:
+        futures: list[Future] = []
+        by_title: dict[str, Future] = {}
+        for story in stream_stories_minimal(
+            llms[PipelineStage.EXTRACT], state["problem_text"], state["fallback_llm"]
+        ):
+            state["stories_minimal"].append(story)
+            dependencies = resolve_references("\n".join(story.Dependencies), by_title)
+            future = executor.submit(
+                refine,
+                story,
+                [by_title[title] for title in sorted(dependencies - {story.Title})],
+            )
+            futures.append(future)
+            by_title[story.Title] = future
+        state["stories"] = [future.result() for future in futures]
+
+
+def run_pipeline(state: State, minimal: bool, pipelined: bool = False) -> State:
+    """
+    Runs the story pipeline on the state: clean, extract and optionally refine and save.
+
+    Args:
+        state (State): The initial agent state.
+        minimal (bool): Only extract the minimal stories, without refining them.
+        pipelined (bool): Overlap extraction and refinement by streaming the extraction.
+
+    Returns:
+        State: The final state, with a report for each stage.
+    """
+    llms = state["llms"]
+    with measure_stage(state, PipelineStage.CLEAN.value):
+        state["problem_text"] = clean_problem_description(
+            llms[PipelineStage.CLEAN], state["orig_problem_text"]
+        )
     save_problem_description(state["problem_text"])
-    stories_minimal = get_stories_minimal(state["llm"], state["problem_text"])
-    state["stories_minimal"] = stories_minimal
-    if not minimal:
-        stories = refine_stories(state["llm"], stories_minimal)
-        state["stories"] = stories
-        for story in stories:
-            save_story(story)
+    if pipelined and not minimal:
+        with measure_stage(state, "extract+refine"):
+            refine_stories_pipelined(state)
+    else:
+        with measure_stage(state, PipelineStage.EXTRACT.value):
+            state["stories_minimal"] = get_stories_minimal(
+                llms[PipelineStage.EXTRACT],
+                state["problem_text"],
+                state["fallback_llm"],
+            )
+        if minimal:
+            return state
+        with measure_stage(state, PipelineStage.REFINE.value):
+            refine_stories_in_batches(state)
+    for story in state["stories"]:
+        save_story(story)
+    return state
+
+
+def _create_stories(
+    provider: str,
+    model: str,
+    problem_text: str,
+    minimal: bool,
+    pipelined: bool,
+    stage_models: dict[PipelineStage, str] | None,
+    cascade_model: str | None,
+) -> list[UserStory] | list[UserStoryMinimal]:
+    state = get_initial_state(
+        provider, model, problem_text, stage_models, cascade_model
+    )
+    with track_structured_output_stats() as stats:
+        run_pipeline(state, minimal, pipelined)
+    logging.info(format_stage_reports(state["reports"]))
+    logging.info(format_structured_output_stats(stats))
+    if minimal:
+        return state["stories_minimal"]
+    return state["stories"]
+
+
+def create_stories(
+    provider: str,
+    model: str,
+    problem_text: str,
+    minimal: bool,
+    pipelined: bool = False,
+    stage_models: dict[PipelineStage, str] | None = None,
+    cascade_model: str | None = None,
+) -> list[UserStory] | list[UserStoryMinimal]:
+    """
+    Creates the user stories of a problem description and logs the stage reports.
+
+    A call identical to one already running in the process (same document,
+    models and mode) waits for it and returns its stories, instead of running
+    the pipeline and saving the stories a second time.
+
+    Args:
+        provider (str): The provider for the language model.
+        model (str): The model to use.
+        problem_text (str): The text of the problem description.
+        minimal (bool): Only extract the minimal stories, without refining them.
+        pipelined (bool): Overlap extraction and refinement by streaming the extraction.
+        stage_models (dict | None): "provider:model" overriding the model of some stages.
+        cascade_model (str | None): "provider:model" to escalate to on invalid
+            or rejected structured output.
+
+    Returns:
+        list: The refined stories, or the minimal stories if minimal is True.
+    """
+    key = make_key(
+        problem_text,
+        provider,
+        model,
+        minimal,
+        pipelined,
+        {stage.value: spec for stage, spec in (stage_models or {}).items()},
+        cascade_model,
+    )
+    return _creations.do(
+        key,
+        _create_stories,
+        provider,
+        model,
+        problem_text,
+        minimal,
+        pipelined,
+        stage_models,
+        cascade_model,
+    )
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, field_validator
+from src.agent import create_stories
+from src.config import (
+    GoogleGenAIModel,
+    ModelProvider,
+    PipelineStage,
+    check_provider,
+    load_config,
+    parse_model_spec,
+)
+from src.storage import (
+    edit_story,
+    get_story_by_title,
+    get_story_titles,
+    remove_all_story,
+    remove_story_by_title,
+    rename_story,
+)
+
+# Requests handled at the same time, the others are rejected with 503
+MAX_CONCURRENT_REQUESTS = 64
+# Story creation jobs running at the same time, the others wait in the queue
+MAX_CONCURRENT_JOBS = 4
+# Jobs waiting or running at the same time, new submissions are rejected with 429
+MAX_PENDING_JOBS = 100
+# Finished jobs kept for polling, the oldest are forgotten first
+MAX_FINISHED_JOBS = 1000
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(BaseModel):
+    """A story creation job"""
+
+    id: str
+    status: JobStatus = JobStatus.QUEUED
+    submitted_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    stories: list[dict] = Field(default_factory=list)
+    error: str | None = None
+
+
+class JobRequest(BaseModel):
+    """A request to create the stories of one or more documents"""
+
+    documents: list[str] = Field(..., min_length=1)
+    provider: str = ModelProvider.GOOGLE_GENAI.value
+    model: str = GoogleGenAIModel.GEMINI_2_5_FLASH_LITE.value
+    minimal: bool = False
+    pipelined: bool = False
+    stage_models: dict[PipelineStage, str] = Field(default_factory=dict)
+    cascade_model: str | None = None
+
+    @field_validator("provider")
+    @classmethod
+    def check_model_provider(cls, value: str):
+        return check_provider(value)
+
+    @field_validator("stage_models")
+    @classmethod
+    def check_stage_models(cls, value: dict[PipelineStage, str]):
+        for spec in value.values():
+            parse_model_spec(spec)
+        return value
+
+    @field_validator("cascade_model")
+    @classmethod
+    def check_cascade_model(cls, value: str | None):
+        if value is not None:
+            parse_model_spec(value)
+        return value
+
+
+class StoryContent(BaseModel):
+    content: str
+
+
+class StoryRename(BaseModel):
+    new_title: str
+
+
+class _Jobs:
+    """
+    Runs the story creation jobs in a bounded pool of worker threads.
+    It keeps the status of the jobs so that clients can poll them.
+    """
+
+    def __init__(self) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="job"
+        )
+        self.jobs: dict[str, Job] = {}
+        self.lock = threading.Lock()
+
+    def _pending(self) -> int:
+        return sum(
+            1
+            for job in self.jobs.values()
+            if job.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+        )
+
+    def _forget_finished(self) -> None:
+        finished = [
+            job
+            for job in self.jobs.values()
+            if job.status in (JobStatus.DONE, JobStatus.FAILED)
+        ]
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def submit(self, request: JobRequest) -> list[Job]:
+        """
+        Queues a job for each document of the request.
+
+        Args:
+            request (JobRequest): The documents and the pipeline options.
+
+        Returns:
+            list[Job]: The queued jobs, in the order of the documents.
+
+        Raises:
+            HTTPException: 429 if the queue cannot take all the documents.
+        """
+        with self.lock:
+            if self._pending() + len(request.documents) > MAX_PENDING_JOBS:
+                raise HTTPException(429, "Too many pending jobs, retry later.")
+            self._forget_finished()
+            jobs = []
+            for document in request.documents:
+                job = Job(id=uuid.uuid4().hex, submitted_at=_now())
+                self.jobs[job.id] = job
+                jobs.append(job.model_copy())
+                self.executor.submit(self._run, job.id, request, document)
+        return jobs
+
+    def _run(self, job_id: str, request: JobRequest, document: str) -> None:
+        self._update(job_id, status=JobStatus.RUNNING, started_at=_now())
+        try:
+            stories = create_stories(
+                request.provider,
+                request.model,
+                document,
+                request.minimal,
+                request.pipelined,
+                request.stage_models,
+                request.cascade_model,
+            )
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed")
+            self._update(
+                job_id, status=JobStatus.FAILED, finished_at=_now(), error=str(e)
+            )
+            return
+        self._update(
+            job_id,
+            status=JobStatus.DONE,
+            finished_at=_now(),
+            stories=[story.model_dump() for story in stories],
+        )
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                self.jobs[job_id] = job.model_copy(update=fields)
+
+    def get(self, job_id: str) -> Job | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def all(self) -> list[Job]:
+        with self.lock:
+            return list(self.jobs.values())
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+load_config()
+_jobs = _Jobs()
+_request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+app = FastAPI(title="AI Agile Dev API")
+
+
+@app.middleware("http")
+async def limit_concurrency(request: Request, call_next):
+    """Rejects the requests exceeding MAX_CONCURRENT_REQUESTS with 503."""
+    if _request_slots.locked():
+        return JSONResponse(
+            {"detail": "Server busy, retry later."},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    async with _request_slots:
+        return await call_next(request)
+
+
+@app.get("/stories")
+def list_stories() -> list[str]:
+    """List all user stories."""
+    return get_story_titles()
+
+
+@app.get("/stories/{title}")
+def get_story(title: str) -> dict:
+    """Get a user story by title."""
+    content = get_story_by_title(title)
+    if content is None:
+        raise HTTPException(404, f"Story '{title}' not found.")
+    return {"title": title, "content": content}
+
+
+@app.put("/stories/{title}")
+def put_story(title: str, body: StoryContent) -> dict:
+    """Edit the content of a user story."""
+    if not edit_story(title, body.content):
+        raise HTTPException(404, f"Story '{title}' not found.")
+    return {"title": title, "content": body.content}
+
+
+@app.post("/stories/{title}/rename")
+def post_story_rename(title: str, body: StoryRename) -> dict:
+    """Rename a user story."""
+    if not body.new_title.strip():
+        raise HTTPException(422, "Title cannot be empty.")
+    if body.new_title != title and body.new_title in get_story_titles():
+        raise HTTPException(
+            409, f"A story with title '{body.new_title}' already exists."
+        )
+    if not rename_story(title, body.new_title):
+        raise HTTPException(404, f"Story '{title}' not found.")
+    return {"title": body.new_title}
+
+
+@app.delete("/stories/{title}", status_code=204)
+def delete_story(title: str) -> None:
+    """Remove a user story by title."""
+    if not remove_story_by_title(title):
+        raise HTTPException(404, f"Story '{title}' not found.")
+
+
+@app.delete("/stories", status_code=204)
+def delete_stories() -> None:
+    """Remove all user stories."""
+    remove_all_story()
+
+
+@app.post("/jobs", status_code=202)
+def post_jobs(request: JobRequest) -> list[Job]:
+    """Queue a story creation job for each document."""
+    return _jobs.submit(request)
+
+
+@app.get("/jobs")
+def list_jobs() -> list[Job]:
+    """List the known jobs."""
+    return _jobs.all()
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> Job:
+    """Get the status and the result of a job."""
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found.")
+    return job
@@ -1,9 +1,12 @@
 import typer
 import logging
-from src.config import load_config
+from src.config import PipelineStage, load_config
 from src.agent import create_stories
 from src.storage import (
+    get_dependency_plan,
+    get_related_stories,
     get_story_by_title,
+    get_story_dependencies,
     get_story_titles,
     remove_story_by_title,
     remove_all_story,
@@ -30,12 +33,45 @@ def create(
     minimal: bool = typer.Option(
         False, help="Only extract minimal user story names without details"
     ),
+    pipelined: bool = typer.Option(
+        False, help="Refine each story as soon as it is extracted"
+    ),
+    clean_model: str = typer.Option(
+        None, help="provider:model for the cleaning stage (e.g., ollama:gemma3)"
+    ),
+    extract_model: str = typer.Option(
+        None, help="provider:model for the extraction stage"
+    ),
+    refine_model: str = typer.Option(
+        None, help="provider:model for the refinement stage"
+    ),
+    cascade_model: str = typer.Option(
+        None,
+        help="provider:model to escalate to when a stage output is invalid or rejected",
+    ),
 ):
     """Create user stories from documentation."""
     load_config()
     with open(doc_path, "r", encoding="utf-8") as f:
         problem_text = f.read()
-    create_stories(provider, model, problem_text, minimal)
+    stage_models = {
+        stage: spec
+        for stage, spec in [
+            (PipelineStage.CLEAN, clean_model),
+            (PipelineStage.EXTRACT, extract_model),
+            (PipelineStage.REFINE, refine_model),
+        ]
+        if spec
+    }
+    create_stories(
+        provider,
+        model,
+        problem_text,
+        minimal,
+        pipelined,
+        stage_models,
+        cascade_model,
+    )
 
 
 @app.command()
@@ -55,6 +91,43 @@ def get(title: str = typer.Argument(..., help="Title of the user story to retrie
     logging.info(content)
 
 
+@app.command()
+def related(
+    title: str = typer.Argument(..., help="Title of the user story"),
+    k: int = typer.Option(5, help="Number of related stories to show"),
+):
+    """List the user stories related to a story."""
+    load_config()
+    stories = get_related_stories(title, k)
+    if not stories:
+        logging.info(f"No related stories found for '{title}'.")
+    for related_title, score in stories:
+        logging.info(f"{score:.2f}  {related_title}")
+
+
+@app.command()
+def deps(title: str = typer.Argument(..., help="Title of the user story")):
+    """Show the stories a story depends on and the ones depending on it."""
+    load_config()
+    depends_on, required_by = get_story_dependencies(title)
+    logging.info(f"Depends on: {', '.join(depends_on) or '-'}")
+    logging.info(f"Required by: {', '.join(required_by) or '-'}")
+
+
+@app.command()
+def plan():
+    """Show the stories in dependency order, in batches that can be done in parallel."""
+    load_config()
+    dependency_plan = get_dependency_plan()
+    for i, batch in enumerate(dependency_plan["batches"], start=1):
+        logging.info(f"Batch {i}: {', '.join(batch)}")
+    if dependency_plan["cyclic"]:
+        logging.info(f"In a dependency cycle: {', '.join(dependency_plan['cyclic'])}")
+    logging.info(
+        f"Critical path: {' -> '.join(dependency_plan['critical_path']) or '-'}"
+    )
+
+
 @app.command()
 def rm(
     title: str = typer.Argument(
@@ -83,5 +156,16 @@ def rm(
         logging.info("Please provide a title or use --all to remove all stories.")
 
 
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Host to bind the HTTP API to"),
+    port: int = typer.Option(8000, help="Port to bind the HTTP API to"),
+):
+    """Serve the HTTP API."""
+    import uvicorn
+
+    uvicorn.run("src.api:app", host=host, port=port)
+
+
 if __name__ == "__main__":
     app()
@@ -19,6 +19,78 @@ class OllamaModel(str, Enum):
     QWEN_3_8B = "qwen-3:8b"
 
 
+class PipelineStage(str, Enum):
+    CLEAN = "clean"
+    EXTRACT = "extract"
+    REFINE = "refine"
+
+
+# Price in USD per million input and output tokens. Local models are free.
+MODEL_PRICING: dict[str, tuple[float, float]] = {
+    GoogleGenAIModel.GEMINI_2_5_FLASH_LITE.value: (0.10, 0.40),
+    GoogleGenAIModel.GEMINI_2_5_FLASH.value: (0.30, 2.50),
+    GoogleGenAIModel.GEMINI_2_5_PRO.value: (1.25, 10.00),
+}
+
+
+def check_provider(provider: str) -> str:
+    """
+    Checks that a provider is one of the supported ModelProvider.
+
+    Args:
+        provider (str): The provider name.
+
+    Returns:
+        str: The provider name.
+
+    Raises:
+        ValueError: If the provider is not supported.
+    """
+    supported = [p.value for p in ModelProvider]
+    if provider not in supported:
+        raise ValueError(
+            f"Unknown provider '{provider}', expected one of: {', '.join(supported)}."
+        )
+    return provider
+
+
+def parse_model_spec(spec: str) -> tuple[str, str]:
+    """
+    Parses a model specification in the "provider:model" format.
+
+    Args:
+        spec (str): The model specification, e.g. "ollama:gemma-3:8b".
+
+    Returns:
+        tuple[str, str]: The provider and the model.
+
+    Raises:
+        ValueError: If the specification has no model or an unknown provider.
+    """
+    provider, _, model = spec.partition(":")
+    if not provider or not model:
+        raise ValueError(f"Invalid model '{spec}', expected 'provider:model'.")
+    return check_provider(provider), model
+
+
+def get_model_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """
+    Returns the cost in USD of the given token usage.
+
+    Args:
+        model (str): The model name.
+        input_tokens (int): The number of input tokens.
+        output_tokens (int): The number of output tokens.
+
+    Returns:
+        float: The cost, 0 for models without a price (e.g. local models).
+    """
+    # Google reports model names as "models/<name>"
+    model = model.removeprefix("models/")
+    input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
 def load_config(dotenv_path=".env"):
     """
     Loads environment variables from a .env file using python-dotenv.
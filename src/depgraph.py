@@ -0,0 +1,451 @@
+import json
+import re
+from typing import Iterable, Iterator, TypedDict
+from src.journal import JournaledIndex
+
+# Dependencies section of a story written with USER_STORY_TEMPLATE
+_SECTION_RE = re.compile(
+    r"^Dependencies:(.*?)(?=^Priority:|\Z)", re.MULTILINE | re.DOTALL
+)
+# A line of a dependencies list, and a part of it separated by commas or semicolons
+_LINE_RE = re.compile(r"[^\n]+")
+_PART_RE = re.compile(r"[^,;\n]+")
+# An item of a dependencies list, without list marker and trailing punctuation
+_ITEM_RE = re.compile(r"\s*(?:[-*+•]\s+|\d+[.)]\s+)?(.*?)[\s.]*$", re.DOTALL)
+
+
+class DependencyPlan(TypedDict):
+    order: list[str]
+    batches: list[list[str]]
+    critical_path: list[str]
+    cyclic: list[str]
+
+
+def _key(title: str) -> str:
+    """Returns the title ignoring case, spacing and a trailing period."""
+    return " ".join(title.casefold().split()).rstrip(".")
+
+
+def _item_spans(text: str) -> Iterator[tuple[tuple[int, int], list[tuple[int, int]]]]:
+    """
+    Yields the candidate items of a dependencies text: for each line, the
+    span of the whole line and the spans of its comma or semicolon separated parts.
+    """
+    for line in _LINE_RE.finditer(text):
+        yield (
+            _ITEM_RE.match(text, *line.span()).span(1),
+            [
+                _ITEM_RE.match(text, *part.span()).span(1)
+                for part in _PART_RE.finditer(text, *line.span())
+            ],
+        )
+
+
+def _item_keys(text: str) -> set[str]:
+    """Returns the keys of all the candidate items of a dependencies text."""
+    return {
+        _key(text[start:end])
+        for line, parts in _item_spans(text)
+        for start, end in [line, *parts]
+    } - {""}
+
+
+class TitleMatcher:
+    """
+    Finds the known story titles listed in a dependencies text.
+
+    A title is found only as a whole item of the list: a line, or a part of
+    a line separated by commas or semicolons, ignoring list markers, case and
+    spacing. A title mentioned within a sentence is not a dependency.
+    """
+
+    def __init__(self, titles: Iterable[str] = ()) -> None:
+        self.titles: dict[str, str] = {}
+        for title in titles:
+            self.add(title)
+
+    def add(self, title: str) -> None:
+        key = _key(title)
+        if key:
+            self.titles[key] = title
+
+    def remove(self, title: str) -> None:
+        key = _key(title)
+        if self.titles.get(key) == title:
+            del self.titles[key]
+
+    def references(self, text: str) -> list[tuple[int, int, str]]:
+        """
+        Returns the items of the text that are known titles.
+
+        A whole line matching a title is not split on its commas, so titles
+        containing commas are found when listed one per line.
+
+        Args:
+            text (str): The dependencies text.
+
+        Returns:
+            list[tuple[int, int, str]]: The start and end of each item in the
+            text, and the title it refers to.
+        """
+        found = []
+        for line, parts in _item_spans(text):
+            if _key(text[slice(*line)]) in self.titles:
+                parts = [line]
+            for start, end in parts:
+                title = self.titles.get(_key(text[start:end]))
+                if title is not None:
+                    found.append((start, end, title))
+        return found
+
+    def find(self, text: str) -> set[str]:
+        """
+        Returns the titles listed in the text.
+
+        Args:
+            text (str): The dependencies text.
+
+        Returns:
+            set[str]: The listed titles.
+        """
+        return {title for _, _, title in self.references(text)}
+
+
+def dependencies_section(content: str) -> str:
+    """
+    Returns the text of the Dependencies section of a story.
+
+    Args:
+        content (str): The markdown content of the story.
+
+    Returns:
+        str: The dependencies text, empty if the story has none.
+    """
+    match = _SECTION_RE.search(content)
+    return match.group(1).strip() if match else ""
+
+
+def _replace_items(text: str, old_title: str, new_title: str) -> str:
+    """Replaces the items of a dependencies text listing old_title."""
+    for start, end, _ in reversed(TitleMatcher([old_title]).references(text)):
+        text = text[:start] + new_title + text[end:]
+    return text
+
+
+def replace_reference(content: str, old_title: str, new_title: str) -> str:
+    """
+    Replaces a story title in the Dependencies section of a story.
+
+    Only the items of the list equal to the old title are replaced, a mention
+    of it within a sentence is left as written.
+
+    Args:
+        content (str): The markdown content of the story.
+        old_title (str): The title to replace.
+        new_title (str): The replacement title.
+
+    Returns:
+        str: The content with the reference updated.
+    """
+    match = _SECTION_RE.search(content)
+    if not match:
+        return content
+    section = _replace_items(match.group(1), old_title, new_title)
+    return content[: match.start(1)] + section + content[match.end(1) :]
+
+
+def resolve_references(text: str, titles: Iterable[str]) -> set[str]:
+    """
+    Returns the story titles listed in a dependencies text.
+
+    Titles are matched as whole items of the list, separated by newlines,
+    commas or semicolons, ignoring case and list markers.
+
+    Args:
+        text (str): The dependencies text.
+        titles (Iterable[str]): The titles of the known stories.
+
+    Returns:
+        set[str]: The listed titles, as written in titles.
+    """
+    return TitleMatcher(titles).find(text)
+
+
+def topological_batches(
+    requires: dict[str, set[str]],
+) -> tuple[list[list[str]], list[str]]:
+    """
+    Groups the stories in batches, each depending only on the previous ones.
+
+    Args:
+        requires (dict[str, set[str]]): The stories required by each story.
+
+    Returns:
+        tuple[list[list[str]], list[str]]: The batches, in dependency order, and
+        the stories left out because they are part of (or depend on) a cycle.
+    """
+    remaining = {title: len(deps & requires.keys()) for title, deps in requires.items()}
+    required_by: dict[str, list[str]] = {title: [] for title in requires}
+    for title, deps in requires.items():
+        for dep in deps & requires.keys():
+            required_by[dep].append(title)
+    batch = sorted(title for title, count in remaining.items() if count == 0)
+    batches = []
+    while batch:
+        batches.append(batch)
+        ready = []
+        for title in batch:
+            del remaining[title]
+            for dependent in required_by[title]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        batch = sorted(ready)
+    return batches, sorted(remaining)
+
+
+def critical_path(requires: dict[str, set[str]], order: list[str]) -> list[str]:
+    """
+    Returns the longest chain of stories each depending on the previous one.
+
+    Args:
+        requires (dict[str, set[str]]): The stories required by each story.
+        order (list[str]): The stories in topological order.
+
+    Returns:
+        list[str]: The chain, from the first story to do to the last.
+    """
+    length: dict[str, int] = {}
+    previous: dict[str, str | None] = {}
+    for title in order:
+        deps = [dep for dep in requires[title] if dep in length]
+        best = max(deps, key=lambda dep: (length[dep], dep), default=None)
+        length[title] = length[best] + 1 if best else 1
+        previous[title] = best
+    if not length:
+        return []
+    title = max(length, key=lambda t: (length[t], t))
+    path = []
+    while title:
+        path.append(title)
+        title = previous[title]
+    return path[::-1]
+
+
+class DependencyGraph(JournaledIndex):
+    """
+    The dependency graph of the stories, parsed from their Dependencies text.
+
+    The text of each story and the resolved edges are persisted by
+    JournaledIndex, so that the graph is loaded without reading the stories.
+    A change re-resolves only the stories listing the changed title, found
+    from an index of the items of every list, and the plan (order, batches
+    and critical path) is cached until the next change.
+    """
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def titles(self) -> list[str]:
+        return list(self.texts)
+
+    def _reset(self) -> None:
+        self.texts: dict[str, str] = {}
+        self.requires: dict[str, set[str]] = {}
+        self.required_by: dict[str, set[str]] = {}
+        self.matcher = TitleMatcher()
+        # The stories listing each item key, known story or not
+        self.listed_by: dict[str, set[str]] = {}
+        self._plan: DependencyPlan | None = None
+
+    def _changed(self) -> None:
+        self._plan = None
+
+    def _read_snapshot(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            self._apply(json.load(f))
+
+    def _write_snapshot(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self._entry([], self.texts)))
+
+    def _apply(self, entry: dict) -> None:
+        """Applies a persisted change: removed stories, then the stories set."""
+        for title in entry["remove"]:
+            self._remove(title)
+        for title, story in entry["set"].items():
+            self._add_node(title, story["text"])
+        for title, story in entry["set"].items():
+            self._unlink(title)
+            for dep in story["requires"]:
+                if dep in self.texts:
+                    self._link(title, dep)
+
+    def _entry(self, removed: Iterable[str], changed: Iterable[str]) -> dict:
+        """Returns the removed stories and the current state of the changed ones."""
+        return {
+            "remove": sorted(removed),
+            "set": {
+                title: {
+                    "text": self.texts[title],
+                    "requires": sorted(self.requires[title]),
+                }
+                for title in changed
+                if title in self.texts
+            },
+        }
+
+    def _log(self, removed: Iterable[str], changed: Iterable[str]) -> None:
+        self._append(self._entry(removed, changed))
+
+    def _add_node(self, title: str, text: str) -> None:
+        if title not in self.texts:
+            self.requires[title] = set()
+            self.required_by[title] = set()
+            self.matcher.add(title)
+        else:
+            self._unlist(title)
+        self.texts[title] = text
+        for key in _item_keys(text):
+            self.listed_by.setdefault(key, set()).add(title)
+
+    def _unlist(self, title: str) -> None:
+        for key in _item_keys(self.texts[title]):
+            self.listed_by[key].discard(title)
+            if not self.listed_by[key]:
+                del self.listed_by[key]
+
+    def _link(self, title: str, dep: str) -> None:
+        self.requires[title].add(dep)
+        self.required_by[dep].add(title)
+
+    def _unlink(self, title: str) -> None:
+        for dep in self.requires[title]:
+            self.required_by[dep].discard(title)
+        self.requires[title] = set()
+
+    def _resolve(self, title: str) -> None:
+        """Recomputes the edges from a story to the ones its text mentions."""
+        self._unlink(title)
+        for dep in self.matcher.find(self.texts[title]) - {title}:
+            self._link(title, dep)
+
+    def _set(self, title: str, text: str) -> set[str]:
+        """Sets the text of a story, returning the stories whose edges changed."""
+        changed = {title}
+        is_new = title not in self.texts
+        self._add_node(title, text)
+        if is_new:
+            # Stories listing the new title now depend on it
+            for other in self.listed_by.get(_key(title), set()) - {title}:
+                self._resolve(other)
+                changed.add(other)
+        self._resolve(title)
+        return changed
+
+    def _remove(self, title: str) -> None:
+        if title not in self.texts:
+            return
+        self._unlink(title)
+        self._unlist(title)
+        for dependent in self.required_by.pop(title):
+            self.requires[dependent].discard(title)
+        del self.requires[title]
+        del self.texts[title]
+        self.matcher.remove(title)
+
+    def set(self, title: str, text: str) -> None:
+        """
+        Adds or replaces the dependencies of a story.
+
+        Args:
+            title (str): The story title.
+            text (str): The dependencies text of the story.
+        """
+        with self._synced():
+            self._log([], self._set(title, text))
+
+    def remove(self, title: str) -> None:
+        """Removes a story from the graph, with its edges."""
+        with self._synced():
+            if title in self.texts:
+                self._remove(title)
+                self._log([title], [])
+
+    def rename(self, old_title: str, new_title: str) -> None:
+        """
+        Renames a story, updating the references of the stories depending on it.
+
+        Args:
+            old_title (str): The current title of the story.
+            new_title (str): The new title of the story.
+        """
+        with self._synced():
+            if old_title in self.texts and old_title != new_title:
+                self._rename(old_title, new_title)
+
+    def _rename(self, old_title: str, new_title: str) -> None:
+        dependents = self.required_by[old_title] - {new_title}
+        text = self.texts[old_title]
+        self._remove(old_title)
+        self._remove(new_title)
+        changed = self._set(new_title, text)
+        for title in dependents:
+            new_text = _replace_items(self.texts[title], old_title, new_title)
+            changed |= self._set(title, new_text)
+        self._log([old_title, new_title], changed)
+
+    def clear(self) -> None:
+        """Removes all the stories from the graph."""
+        self.rebuild([])
+
+    def rebuild(self, stories: Iterable[tuple[str, str]]) -> None:
+        """
+        Replaces the whole graph with the given stories.
+
+        Args:
+            stories (Iterable[tuple[str, str]]): The title and dependencies
+                text of each story.
+        """
+        with self._synced():
+            self._reset()
+            for title, text in stories:
+                self._add_node(title, text)
+            for title in self.texts:
+                self._resolve(title)
+            self._compact()
+
+    def dependencies(self, title: str) -> list[str]:
+        """Returns the stories the given one depends on."""
+        with self._synced():
+            return sorted(self.requires.get(title, ()))
+
+    def dependents(self, title: str) -> list[str]:
+        """Returns the stories depending on the given one."""
+        with self._synced():
+            return sorted(self.required_by.get(title, ()))
+
+    def plan(self) -> DependencyPlan:
+        """
+        Returns the stories in dependency order.
+
+        Returns:
+            DependencyPlan: The topological order, the batches of stories that
+            can be done in parallel, the critical path and the stories left out
+            of the order because of a dependency cycle.
+        """
+        with self._synced():
+            if self._plan is None:
+                self._plan = self._make_plan()
+            return self._plan
+
+    def _make_plan(self) -> DependencyPlan:
+        batches, cyclic = topological_batches(self.requires)
+        order = [title for batch in batches for title in batch]
+        return {
+            "order": order,
+            "batches": batches,
+            "critical_path": critical_path(self.requires, order),
+            "cyclic": cyclic,
+        }
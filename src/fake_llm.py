@@ -0,0 +1,183 @@
+import json
+import random
+import re
+import time
+from operator import itemgetter
+from typing import Any, Iterator, Optional
+from pydantic import BaseModel
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.runnables import Runnable, RunnableMap, RunnablePassthrough
+
+
+class FakeStoryChatModel(BaseChatModel):
+    """
+    An offline chat model that imitates the story pipeline responses.
+
+    It recognises the clean, extract and refine prompts of src.genai and answers
+    with deterministic content derived from the input, streaming it chunk by
+    chunk with a configurable delay so that latency can be measured without
+    any network access. To imitate small models, a share of the structured
+    answers can be rejected by the quality checks (failure_rate) or be
+    malformed (malformed_rate). Token usage is estimated at 4 characters per
+    token under the model name, so that costs can be computed.
+    """
+
+    model: str = "fake"
+    first_token_latency: float = 0.05
+    chunk_latency: float = 0.005
+    chunk_size: int = 8
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    seed: int = 0
+    _random: random.Random | None = None
+
+    def _draw(self, rate: float) -> bool:
+        if self._random is None:
+            self._random = random.Random(self.seed)
+        return self._random.random() < rate
+
+    def _malform(self, data: dict) -> str:
+        """Returns the data as JSON, malformed as small models often do."""
+        text = json.dumps(data)
+        if not self._draw(self.malformed_rate):
+            return text
+        kind = self._random.choice(["prose", "fences", "keys", "truncated"])
+        if kind == "prose":
+            return f"Sure! Here is the result:\n{text}\nLet me know if you need more."
+        if kind == "fences":
+            return f"```json\n{text}\n```\nThe JSON above matches the schema."
+        if kind == "keys":
+            return json.dumps(_snake_case_keys(data))
+        return text[: len(text) * 3 // 4]
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-story-chat-model"
+
+    def _respond(self, messages: list[BaseMessage]) -> str:
+        system = " ".join(str(m.content) for m in messages if m.type == "system")
+        human = "\n".join(str(m.content) for m in messages if m.type == "human")
+        if "extract a list of possible user stories" in system:
+            sentences = [s.strip() for s in re.split(r"[.\n]+", human) if s.strip()]
+            titles = [" ".join(s.split()[:5]) for s in sentences]
+            # Every story depends on the first one of its group of three
+            stories = [
+                {
+                    "Title": title,
+                    "Description": sentence,
+                    "Dependencies": [titles[i - i % 3]] if i % 3 else [],
+                }
+                for i, (title, sentence) in enumerate(zip(titles, sentences))
+            ]
+            if self._draw(self.failure_rate):
+                # An answer that validates but is rejected by the quality checks
+                stories = []
+            return self._malform({"Stories": stories})
+        if "detailed user story" in system:
+            title = re.search(r"User Story Title: (.*)", human)
+            description = re.search(r"Description: (.*)", human)
+            depends_on = re.search(r"Depends on:\n(.*?)\n\n", human, re.DOTALL)
+            dependencies = re.findall(
+                r"^- (.+?)(?:: .*)?$",
+                depends_on.group(1) if depends_on else "",
+                re.MULTILINE,
+            )
+            story = {
+                "Title": title.group(1) if title else "",
+                "Description": description.group(1) if description else "",
+                "AcceptanceCriteria": "- The feature works as described.",
+                "Dependencies": ", ".join(dependencies),
+            }
+            if self._draw(self.failure_rate):
+                # An answer that validates but is rejected by the quality checks
+                story["AcceptanceCriteria"] = ""
+            return self._malform(story)
+        return human
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(text) // 4
+        time.sleep(self.first_token_latency)
+        for i in range(0, len(text), self.chunk_size):
+            time.sleep(self.chunk_latency)
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=text[i : i + self.chunk_size])
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                response_metadata={"model_name": self.model},
+                usage_metadata={
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "total_tokens": input_tokens + output_tokens,
+                },
+            )
+        )
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        chunks = list(self._stream(messages, stop, **kwargs))
+        message = chunks[0].message
+        for chunk in chunks[1:]:
+            message += chunk.message
+        return ChatResult(
+            generations=[
+                ChatGeneration(
+                    message=AIMessage(
+                        content=message.content,
+                        response_metadata=message.response_metadata,
+                        usage_metadata=message.usage_metadata,
+                    )
+                )
+            ]
+        )
+
+    def with_structured_output(
+        self, schema: Any, *, include_raw: bool = False, **kwargs: Any
+    ) -> Runnable:
+        """Parses the JSON content of the response into the given pydantic schema."""
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+            raise ValueError("FakeStoryChatModel only supports pydantic schemas.")
+        parser = PydanticOutputParser(pydantic_object=schema)
+        if not include_raw:
+            return self | parser
+        parser_assign = RunnablePassthrough.assign(
+            parsed=itemgetter("raw") | parser, parsing_error=lambda _: None
+        )
+        parser_none = RunnablePassthrough.assign(parsed=lambda _: None)
+        parser_with_fallback = parser_assign.with_fallbacks(
+            [parser_none], exception_key="parsing_error"
+        )
+        return RunnableMap(raw=self) | parser_with_fallback
+
+
+def _snake_case_keys(value):
+    """Renames the keys of the value from CamelCase to snake_case, recursively."""
+    if isinstance(value, list):
+        return [_snake_case_keys(item) for item in value]
+    if isinstance(value, dict):
+        return {
+            re.sub(r"(?<!^)(?=[A-Z])", "_", key).lower(): _snake_case_keys(item)
+            for key, item in value.items()
+        }
+    return value
@@ -1,6 +1,16 @@
+import json
 import logging
-from pydantic import BaseModel, Field
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, get_args, get_origin
+from pydantic import BaseModel, Field, ValidationError
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.language_models.chat_models import BaseChatModel
 
 USER_STORY_TEMPLATE = (
@@ -13,6 +23,16 @@ USER_STORY_TEMPLATE = (
     "Priority: {priority}"
 )
 
+# Number of times a structured output call is repeated when the answer cannot be repaired
+STRUCTURED_OUTPUT_RETRIES = 1
+
+# Counters of the structured output calls, shared by all the pipelines of the process
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+# Counters of the structured output calls of the current run, if it tracks them
+_run_stats: ContextVar[Counter | None] = ContextVar("run_stats", default=None)
+_STATS_KEYS = ("calls", "repaired", "retried", "failed", "escalations")
+
 
 class UserStoryMinimal(BaseModel):
     """The agile user story simple data"""
@@ -25,6 +45,10 @@ class UserStoryMinimal(BaseModel):
         ...,
         description="A brief description of the functionality.",
     )
+    Dependencies: list[str] = Field(
+        default_factory=list,
+        description="The titles of the other user stories this one depends on.",
+    )
 
 
 class UserStoriesMinimal(BaseModel):
@@ -53,7 +77,8 @@ class UserStory(BaseModel):
     )
     Dependencies: str = Field(
         default="",
-        description="Dependencies.",
+        description="The titles of the other user stories this one depends on, "
+        "separated by commas.",
     )
 
     def to_template_string(self) -> str:
@@ -67,6 +92,478 @@ class UserStory(BaseModel):
         )
 
 
+def get_structured_output_stats() -> dict[str, int]:
+    """
+    Returns the counters of the structured output calls made so far.
+
+    Returns:
+        dict[str, int]: The "calls" made, the answers "repaired" locally, the
+        calls "retried", the calls "failed" and the "escalations" to the
+        fallback model.
+    """
+    with _stats_lock:
+        return {key: _stats[key] for key in _STATS_KEYS}
+
+
+def format_structured_output_stats(stats: dict[str, int]) -> str:
+    """Returns the structured output counters with the rates per call."""
+    calls = stats["calls"] or 1
+    return "Structured output: " + ", ".join(
+        [f"{stats['calls']} calls"]
+        + [f"{stats[key]} {key} ({stats[key] / calls:.0%})" for key in _STATS_KEYS[1:]]
+    )
+
+
+@contextmanager
+def track_structured_output_stats() -> Iterator[Counter]:
+    """
+    Counts the structured output calls made within the block.
+
+    The calls made by other runs at the same time are not counted, while the
+    calls made by the worker threads started with a copy of the context (like
+    ContextThreadPoolExecutor) are.
+
+    Yields:
+        Counter: The counters of the block, with the keys of
+        get_structured_output_stats.
+    """
+    stats: Counter = Counter()
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+def _count(key: str) -> None:
+    run_stats = _run_stats.get()
+    with _stats_lock:
+        _stats[key] += 1
+        if run_stats is not None:
+            run_stats[key] += 1
+
+
+def _message_text(content: str | list) -> str:
+    """Returns the text of a message content, which may be a list of parts."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
+    )
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[\s_\-]", "", str(key)).lower()
+
+
+def _open_brackets(text: str) -> list[list] | None:
+    """
+    Scans the JSON value starting the text for the brackets left open at its end.
+
+    Args:
+        text (str): The text, starting with an opening bracket.
+
+    Returns:
+        list[list] | None: The open brackets, outermost first, each with the
+        position of its last comma and the key it is the value of, if any.
+        None if the value is closed before the end.
+    """
+    stack: list[list] = []
+    in_string = False
+    escape = False
+    string_start = 0
+    last_string = key = None
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                last_string = text[string_start + 1 : i]
+        elif char == '"':
+            in_string = True
+            string_start = i
+        elif char == ":":
+            key = last_string
+        elif char in "[{":
+            in_object = bool(stack) and stack[-1][0] == "{"
+            stack.append([char, None, key if in_object else None])
+            key = None
+        elif char in "]}":
+            stack.pop()
+            if not stack:
+                return None
+        elif char == ",":
+            stack[-1][1] = i
+            key = None
+    return stack
+
+
+def _model_list_fields(schema: type[BaseModel]) -> set[str]:
+    """Returns the normalized names of the list of model fields of the schema."""
+    fields = set()
+    for name, field in schema.model_fields.items():
+        args = get_args(field.annotation)
+        if (
+            get_origin(field.annotation) is list
+            and args
+            and isinstance(args[0], type)
+            and issubclass(args[0], BaseModel)
+        ):
+            fields.add(_normalize_key(name))
+    return fields
+
+
+def _close_truncated(
+    text: str, stack: list[list], schema: type[BaseModel] | None
+) -> str | None:
+    """
+    Completes a JSON value cut off by the end of the text.
+
+    Only a list of items of the schema, like the Stories of UserStoriesMinimal,
+    is salvaged: the value is cut back to the last comma of that list, then
+    the brackets are closed. The cut off item is dropped, even if it looks
+    complete, and no cut off string or object is ever closed.
+
+    Args:
+        text (str): The text, starting with the value.
+        stack (list[list]): The brackets left open, from _open_brackets.
+        schema (type[BaseModel] | None): The schema of the value, None to
+            never salvage it.
+
+    Returns:
+        str | None: The completed value, or None if the outermost open list is
+        not a list of items of the schema or has no item completed before the cut.
+    """
+    list_fields = _model_list_fields(schema) if schema else set()
+    for depth, (char, comma, key) in enumerate(stack):
+        if char != "[":
+            continue
+        # A bare list is assigned to the list field by _coerce
+        is_items = (key is None and depth == 0) or (
+            key is not None and _normalize_key(key) in list_fields
+        )
+        if not list_fields or not is_items or comma is None:
+            return None
+        closing = "".join("]" if c == "[" else "}" for c, _, _ in stack[: depth + 1])
+        return text[:comma] + closing[::-1]
+    return None
+
+
+def _cut_off(text: str, error: json.JSONDecodeError) -> bool:
+    """Tells whether decoding failed because the text ended, not on invalid JSON."""
+    if error.msg.startswith("Unterminated string"):
+        return True
+    rest = text[error.pos :].rstrip()
+    # The end of the text, or a literal cut in the middle
+    return any(literal.startswith(rest) for literal in ("true", "false", "null"))
+
+
+def _find_json(text: str, schema: type[BaseModel] | None = None) -> tuple[Any, bool]:
+    """
+    Finds the JSON value in a model answer.
+
+    Tolerates code fences and prose around the value, skipping the brackets
+    of the prose, even when they are never closed. A value cut off by the end
+    of the text is accepted only when it was cut inside a list of items of the
+    schema, keeping the items completed before the cut.
+
+    Args:
+        text (str): The model answer.
+        schema (type[BaseModel] | None): The schema of the value.
+
+    Returns:
+        tuple[Any, bool]: The parsed value, or None if there is none, and
+        whether the value was cut off.
+    """
+    decoder = json.JSONDecoder()
+    for start, char in enumerate(text):
+        if char not in "{[":
+            continue
+        try:
+            # Ignores whatever follows the value
+            value, _ = decoder.raw_decode(text, start)
+            return value, False
+        except json.JSONDecodeError as e:
+            if not _cut_off(text, e):
+                # Brackets in the prose, the value may start further on
+                continue
+        # Every later start is inside the cut off value, it is the answer
+        stack = _open_brackets(text[start:]) or []
+        closed = _close_truncated(text[start:], stack, schema)
+        if closed is None:
+            return None, True
+        try:
+            return json.loads(closed), True
+        except json.JSONDecodeError:
+            return None, True
+    return None, False
+
+
+def _load_json(text: str, schema: type[BaseModel] | None = None) -> Any:
+    """Returns the JSON value in a model answer, see _find_json."""
+    return _find_json(text, schema)[0]
+
+
+def _coerce(value: Any, schema: type[BaseModel]) -> Any:
+    """
+    Maps a parsed value onto the schema fields.
+
+    Keys are matched ignoring case and separators, a bare list is assigned to
+    the only list field, a single wrapping object is unwrapped, lists given
+    for text fields are joined as bullet points and text given for list of
+    text fields is split on commas and lines.
+
+    Args:
+        value (Any): The parsed value.
+        schema (type[BaseModel]): The pydantic schema.
+
+    Returns:
+        Any: The value to validate against the schema.
+    """
+    fields = schema.model_fields
+    if isinstance(value, list):
+        list_fields = [n for n, f in fields.items() if get_origin(f.annotation) is list]
+        if len(list_fields) == 1:
+            value = {list_fields[0]: value}
+    if not isinstance(value, dict):
+        return value
+    names = {_normalize_key(name): name for name in fields}
+    data = {}
+    for key, item in value.items():
+        name = names.get(_normalize_key(key))
+        if name is None:
+            continue
+        annotation = fields[name].annotation
+        if annotation is str and isinstance(item, list):
+            item = "\n".join(f"- {i}" for i in item)
+        elif annotation == list[str] and item is None:
+            item = []
+        elif annotation == list[str] and isinstance(item, str):
+            parts = (
+                part.strip().lstrip("-* ").strip() for part in re.split(r"[,;\n]", item)
+            )
+            item = [part for part in parts if part]
+        elif get_origin(annotation) is list and isinstance(item, list):
+            (item_schema,) = get_args(annotation)
+            if isinstance(item_schema, type) and issubclass(item_schema, BaseModel):
+                item = [_coerce(i, item_schema) for i in item]
+        data[name] = item
+    if not data and len(value) == 1:
+        (inner,) = value.values()
+        if isinstance(inner, (dict, list)):
+            return _coerce(inner, schema)
+    return data
+
+
+def _validate_salvaging(data: Any, schema: type[BaseModel]) -> BaseModel | None:
+    """
+    Validates the data, dropping the invalid items of the list fields.
+
+    This salvages the valid items of a list where some items are malformed.
+
+    Args:
+        data (Any): The coerced data.
+        schema (type[BaseModel]): The pydantic schema.
+
+    Returns:
+        BaseModel | None: The validated result, or None if it is not valid.
+    """
+    try:
+        return schema.model_validate(data)
+    except ValidationError:
+        if not isinstance(data, dict):
+            return None
+    for name, field in schema.model_fields.items():
+        item_schema = get_args(field.annotation)
+        if get_origin(field.annotation) is not list or not item_schema:
+            continue
+        items = data.get(name)
+        if not isinstance(items, list):
+            continue
+        valid = []
+        for item in items:
+            try:
+                valid.append(item_schema[0].model_validate(item))
+            except ValidationError:
+                continue
+        if not valid:
+            return None
+        data = {**data, name: valid}
+    try:
+        return schema.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def repair_structured_output(
+    raw: BaseMessage | str, schema: type[BaseModel]
+) -> BaseModel | None:
+    """
+    Tries to recover a structured result from an answer that failed to parse.
+
+    The tool call arguments and the text of the answer are parsed tolerantly
+    and coerced to the schema. A truncated answer is repaired only when it was
+    cut inside a list: the items completed before the cut are kept, the cut
+    off one is dropped. Anything else is left to a retry.
+
+    Args:
+        raw (BaseMessage | str): The raw model answer.
+        schema (type[BaseModel]): The pydantic schema of the output.
+
+    Returns:
+        BaseModel | None: The repaired result, or None if it cannot be repaired.
+    """
+    candidates: list = []
+    if isinstance(raw, BaseMessage):
+        candidates += [call["args"] for call in getattr(raw, "tool_calls", [])]
+        candidates += [call["args"] for call in getattr(raw, "invalid_tool_calls", [])]
+        candidates.append(_message_text(raw.content))
+    else:
+        candidates.append(raw)
+    for candidate in candidates:
+        value = (
+            _load_json(candidate, schema) if isinstance(candidate, str) else candidate
+        )
+        if value is None:
+            continue
+        result = _validate_salvaging(_coerce(value, schema), schema)
+        if result is not None:
+            return result
+    return None
+
+
+def story_quality_issues(story: UserStory) -> list[str]:
+    """
+    Checks that a refined user story is usable.
+
+    Args:
+        story (UserStory): The refined user story.
+
+    Returns:
+        list[str]: The problems found, empty if the story is acceptable.
+    """
+    issues = []
+    if not story.Title.strip():
+        issues.append("empty title")
+    if not story.Description.strip():
+        issues.append("empty description")
+    if not story.AcceptanceCriteria.strip():
+        issues.append("empty acceptance criteria")
+    return issues
+
+
+def stories_minimal_quality_issues(result: UserStoriesMinimal) -> list[str]:
+    """
+    Checks that the extracted user stories are usable.
+
+    Args:
+        result (UserStoriesMinimal): The extracted user stories.
+
+    Returns:
+        list[str]: The problems found, empty if the stories are acceptable.
+    """
+    if not result.Stories:
+        return ["no stories extracted"]
+    if any(not story.Title.strip() for story in result.Stories):
+        return ["story without title"]
+    return []
+
+
+def _parse_with_repair(llm: BaseChatModel, schema: type[BaseModel], prompt):
+    """
+    Invokes the model with structured output, repairing or retrying invalid answers.
+
+    An answer that does not parse is first repaired locally, and the call is
+    repeated only if the repair fails too. A truncated text answer is never
+    taken as parsed, as some output parsers close its open strings and
+    brackets: it goes through the repair, which keeps only complete list items.
+
+    Args:
+        llm (BaseChatModel): The model to invoke.
+        schema (type[BaseModel]): The pydantic schema of the output.
+        prompt: The prompt to send.
+
+    Returns:
+        BaseModel | None: The parsed result, or None if every attempt failed.
+    """
+    structured_llm = llm.with_structured_output(schema, include_raw=True)
+    for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
+        if attempt:
+            _count("retried")
+        output = structured_llm.invoke(prompt)
+        truncated = _find_json(_message_text(output["raw"].content), schema)[1]
+        if output["parsed"] is not None and not truncated:
+            return output["parsed"]
+        repaired = repair_structured_output(output["raw"], schema)
+        if repaired is not None:
+            _count("repaired")
+            return repaired
+        logging.warning(f"Invalid {schema.__name__} output: {output['parsing_error']}")
+    return None
+
+
+def _escalate(
+    fallback_llm: BaseChatModel, schema: type[BaseModel], prompt, issues: list[str]
+):
+    """Repeats a structured output call on the fallback model, as the same call."""
+    logging.info(f"Escalating {schema.__name__} to the fallback model: {issues}")
+    _count("escalations")
+    return _parse_with_repair(fallback_llm, schema, prompt)
+
+
+def _invoke_structured(
+    llm: BaseChatModel,
+    schema: type[BaseModel],
+    prompt,
+    fallback_llm: BaseChatModel | None = None,
+    check: Callable[[BaseModel], list[str]] | None = None,
+):
+    """
+    Invokes the model with structured output, escalating to a fallback model.
+
+    The fallback model is used only when the output of the first model
+    cannot be parsed, repaired or retried, or is rejected by the quality check.
+    A rejected first result is kept if the fallback model gives no valid output.
+
+    Args:
+        llm (BaseChatModel): The model to try first.
+        schema (type[BaseModel]): The pydantic schema of the output.
+        prompt: The prompt to send.
+        fallback_llm (BaseChatModel | None): The model to escalate to, if any.
+        check (Callable | None): Returns the quality issues of a parsed result.
+
+    Returns:
+        BaseModel: The parsed result.
+
+    Raises:
+        OutputParserException: If no valid output could be obtained.
+    """
+    _count("calls")
+    result = _parse_with_repair(llm, schema, prompt)
+    if result is None:
+        issues = ["invalid output"]
+    else:
+        issues = check(result) if check else []
+    if issues and fallback_llm is not None:
+        escalated = _escalate(fallback_llm, schema, prompt, issues)
+        if escalated is not None:
+            result = escalated
+        elif result is not None:
+            # The first result only failed the quality check, it beats nothing
+            logging.warning(
+                f"No valid {schema.__name__} output from the fallback model, "
+                f"keeping the first one despite: {issues}"
+            )
+    if result is None:
+        _count("failed")
+        raise OutputParserException(f"No valid {schema.__name__} output.")
+    return result
+
+
 def clean_problem_description(llm: BaseChatModel, problem_desc: str) -> str:
     """
     Cleans the problem description by removing irrelevant information.
@@ -106,92 +603,291 @@ def clean_problem_description(llm: BaseChatModel, problem_desc: str) -> str:
     return text
 
 
+def _stories_minimal_prompt(problem_desc: str):
+    """Returns the prompt extracting the minimal stories of a problem description."""
+    prompt_template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are an expert agile analyst. "
+                "Given the following problem description, extract a list of possible user stories. "
+                "Return Python list of short user story titles and brief descriptions, "
+                "with the titles of the other stories each one depends on",
+            ),
+            ("human", "{problem_desc}"),
+        ]
+    )
+    return prompt_template.invoke({"problem_desc": problem_desc})
+
+
 def get_stories_minimal(
-    llm: BaseChatModel, problem_desc: str
+    llm: BaseChatModel,
+    problem_desc: str,
+    fallback_llm: BaseChatModel | None = None,
 ) -> list[UserStoryMinimal]:
     """
     Analyzes the problem description and extracts a list of user story names.
 
     Args:
-        state (State): The current state containing the problem description and LLM.
+        llm (BaseChatModel): The language model to use for extraction.
+        problem_desc (str): The cleaned problem description.
+        fallback_llm (BaseChatModel | None): The model to escalate to on invalid output.
 
     Returns:
-        dict: Updated state with 'stories_name' as a list of story titles.
+        list[UserStoryMinimal]: The extracted user stories.
+    """
+    prompt = _stories_minimal_prompt(problem_desc)
+    # We expect the LLM to return a Python list of strings
+    result = _invoke_structured(
+        llm,
+        UserStoriesMinimal,
+        prompt,
+        fallback_llm,
+        stories_minimal_quality_issues,
+    )
+    stories = result.Stories
+
+    for story in stories:
+        logging.debug(story.Title)
+        logging.debug(story.Description)
+        logging.debug("-----")
+
+    return stories
+
+
+def stream_stories_minimal(
+    llm: BaseChatModel,
+    problem_desc: str,
+    fallback_llm: BaseChatModel | None = None,
+) -> Iterator[UserStoryMinimal]:
     """
+    Streams the story extraction and yields each user story as soon as it is complete.
+
+    The response is requested as JSON and scanned incrementally: each item of
+    the Stories list is parsed and yielded as soon as its closing bracket is
+    streamed. If the stream has not the expected shape, the whole answer is
+    repaired once at the end, like repair_structured_output.
+
+    If no valid story can be obtained from the stream, the extraction is
+    escalated to the fallback model without streaming, if one is given.
+
+    Args:
+        llm (BaseChatModel): The language model to use for extraction.
+        problem_desc (str): The cleaned problem description.
+        fallback_llm (BaseChatModel | None): The model to escalate to on invalid output.
+
+    Yields:
+        UserStoryMinimal: The extracted user stories, in response order.
+
+    Raises:
+        OutputParserException: If no valid story could be obtained.
+    """
+    parser = JsonOutputParser(pydantic_object=UserStoriesMinimal)
     prompt_template = ChatPromptTemplate.from_messages(
         [
             (
                 "system",
                 "You are an expert agile analyst. "
                 "Given the following problem description, extract a list of possible user stories. "
-                "Return Python list of short user story titles and brief descriptions",
+                "Return short user story titles and brief descriptions, "
+                "with the titles of the other stories each one depends on.\n"
+                "{format_instructions}",
             ),
             ("human", "{problem_desc}"),
         ]
-    )
+    ).partial(format_instructions=parser.get_format_instructions())
+
+    _count("calls")
+    chain = prompt_template | llm
+    scanner = _ListItemScanner()
+    valid = 0
+    for chunk in chain.stream({"problem_desc": problem_desc}):
+        for item in scanner.feed(_message_text(chunk.content)):
+            story = _to_story_minimal(_coerce(item, UserStoryMinimal))
+            if story:
+                valid += 1
+                yield story
+    if not valid:
+        # Not the expected shape for the streaming parse, e.g. brackets in the
+        # prose before the JSON: parse the whole answer once
+        result = repair_structured_output(scanner.text, UserStoriesMinimal)
+        for story in result.Stories if result else []:
+            valid += 1
+            yield story
+    if not valid and fallback_llm is not None:
+        result = _escalate(
+            fallback_llm,
+            UserStoriesMinimal,
+            _stories_minimal_prompt(problem_desc),
+            ["no valid story in the stream"],
+        )
+        if result is None:
+            _count("failed")
+            raise OutputParserException("No valid UserStoriesMinimal output.")
+        yield from result.Stories
+    elif not valid:
+        _count("failed")
+        raise OutputParserException("No valid UserStoriesMinimal output.")
 
-    structured_llm = llm.with_structured_output(UserStoriesMinimal)
-    prompt = prompt_template.invoke({"problem_desc": problem_desc})
-    # We expect the LLM to return a Python list of strings
-    result = structured_llm.invoke(prompt)
-    stories = result.Stories
 
-    for story in stories:
-        logging.debug(story.Title)
-        logging.debug(story.Description)
-        logging.debug("-----")
+class _ListItemScanner:
+    """
+    Finds the items of a streamed JSON list as soon as each one is complete.
 
-    return stories
+    The list is either the streamed value itself or the first list in it,
+    like {"Stories": [...]}. Each chunk is scanned once, keeping the string
+    and bracket state across chunks, and an item is parsed only when its
+    closing bracket arrives, so the cost is linear in the answer length.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.list_depth: int | None = None
+        self.item_start: int | None = None
+
+    def feed(self, chunk: str) -> list[Any]:
+        """
+        Scans a chunk of the answer.
+
+        Args:
+            chunk (str): The next chunk of the answer.
+
+        Returns:
+            list[Any]: The list items completed by the chunk.
+        """
+        offset = len(self.text)
+        self.text += chunk
+        items = []
+        for i, char in enumerate(chunk, start=offset):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.depth == 0 and char not in "[{":
+                # Prose or code fences around the value
+                continue
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+                if char == "[" and self.list_depth is None and self.depth <= 2:
+                    self.list_depth = self.depth
+                elif self.depth - 1 == self.list_depth and self.item_start is None:
+                    self.item_start = i
+            elif char in "]}":
+                if self.depth - 1 == self.list_depth and self.item_start is not None:
+                    try:
+                        items.append(json.loads(self.text[self.item_start : i + 1]))
+                    except json.JSONDecodeError:
+                        logging.warning("Skipping a malformed streamed story.")
+                    self.item_start = None
+                self.depth -= 1
+                if self.depth == self.list_depth and char == "]":
+                    # The list is over, ignore anything after it
+                    self.list_depth = -1
+        return items
+
+
+def _to_story_minimal(item) -> UserStoryMinimal | None:
+    """Validates a parsed item, returning None if it is not a valid story."""
+    try:
+        story = UserStoryMinimal.model_validate(item)
+    except ValidationError as e:
+        logging.warning(f"Skipping malformed story {item!r}: {e}")
+        return None
+    logging.debug(story.Title)
+    logging.debug(story.Description)
+    logging.debug("-----")
+    return story
+
+
+def refine_story(
+    llm: BaseChatModel,
+    story: UserStoryMinimal,
+    fallback_llm: BaseChatModel | None = None,
+    dependencies: list[UserStory] | None = None,
+) -> UserStory:
+    """
+    Refines a single user story by adding detailed information.
+
+    Args:
+        llm (BaseChatModel): The language model to use for refinement.
+        story (UserStoryMinimal): The minimal user story to refine.
+        fallback_llm (BaseChatModel | None): The model to escalate to on invalid
+            or poor output.
+        dependencies (list[UserStory] | None): The refined stories this one
+            depends on, given as context with the other titles in story.Dependencies.
+
+    Returns:
+        UserStory: The detailed user story.
+    """
+    prompt_template = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are an expert agile analyst. "
+                "Given the following user story title and description, "
+                "provide a detailed user story with all fields filled out. "
+                "Return the result as a JSON object matching the UserStory schema.",
+            ),
+            (
+                "human",
+                "User Story Title: {title}\n\n"
+                "Description: {description}\n\n"
+                "Depends on:\n{dependencies}\n\n"
+                "Provide the following fields:\n"
+                "- Role\n"
+                "- Feature\n"
+                "- Benefit\n"
+                "- Acceptance Criteria\n"
+                "- Constraints\n"
+                "- Performance\n"
+                "- Security\n"
+                "- Dependencies\n"
+                "- Priority\n"
+                "- Estimate\n"
+                "- Attachments",
+            ),
+        ]
+    )
+    refined = {dep.Title.casefold() for dep in dependencies or []}
+    context = [f"- {dep.Title}: {dep.Description}" for dep in dependencies or []]
+    context += [
+        f"- {title}" for title in story.Dependencies if title.casefold() not in refined
+    ]
+    prompt = prompt_template.invoke(
+        {
+            "title": story.Title,
+            "description": story.Description,
+            "dependencies": "\n".join(context) or "None",
+        }
+    )
+    return _invoke_structured(
+        llm, UserStory, prompt, fallback_llm, story_quality_issues
+    )
 
 
 def refine_stories(
-    llm: BaseChatModel, stories_minimal: list[UserStoryMinimal]
+    llm: BaseChatModel,
+    stories_minimal: list[UserStoryMinimal],
+    fallback_llm: BaseChatModel | None = None,
 ) -> list[UserStory]:
     """
     Refines each user story by adding detailed information.
 
     Args:
-        state (State): The current state containing minimal user stories and LLM.
+        llm (BaseChatModel): The language model to use for refinement.
+        stories_minimal (list[UserStoryMinimal]): The minimal user stories.
+        fallback_llm (BaseChatModel | None): The model to escalate to on invalid
+            or poor output.
 
     Returns:
-        State: Updated state with detailed user stories.
-    """
-    structured_llm = llm.with_structured_output(UserStory)
-
-    detailed_stories = []
-    for story in stories_minimal:
-        prompt_template = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are an expert agile analyst. "
-                    "Given the following user story title and description, "
-                    "provide a detailed user story with all fields filled out. "
-                    "Return the result as a JSON object matching the UserStory schema.",
-                ),
-                (
-                    "human",
-                    "User Story Title: {title}\n\n"
-                    "Description: {description}\n\n"
-                    "Provide the following fields:\n"
-                    "- Role\n"
-                    "- Feature\n"
-                    "- Benefit\n"
-                    "- Acceptance Criteria\n"
-                    "- Constraints\n"
-                    "- Performance\n"
-                    "- Security\n"
-                    "- Dependencies\n"
-                    "- Priority\n"
-                    "- Estimate\n"
-                    "- Attachments",
-                ),
-            ]
-        )
-        prompt = prompt_template.invoke(
-            {"title": story.Title, "description": story.Description}
-        )
-        detailed_story = structured_llm.invoke(prompt)
-        detailed_stories.append(detailed_story)
-
-    return detailed_stories
+        list[UserStory]: The detailed user stories.
+    """
+    return [refine_story(llm, story, fallback_llm) for story in stories_minimal]
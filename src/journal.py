@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows, the processes sharing the files are not serialized
+    fcntl = None
+
+# Journal entries after which the snapshot is rewritten
+COMPACT_EVERY = 1000
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on a file, serializing the processes sharing it.
+
+    Args:
+        path (str): Path of the lock file, created if missing.
+    """
+    with open(path, "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class JournaledIndex(ABC):
+    """
+    Base class of the indexes persisted as a snapshot plus a journal of the
+    changes made since, so that an update appends a line instead of rewriting
+    the whole index. The snapshot is rewritten every COMPACT_EVERY entries.
+
+    The files can be shared by several processes, like the UI, the API and
+    the CLI. Reads and writes hold a lock on the files and first catch up
+    with the other processes: the new journal entries are replayed, and the
+    whole index is reloaded if the snapshot was rewritten.
+
+    Subclasses implement _reset, _read_snapshot, _write_snapshot and _apply,
+    and run their reads and writes within _synced.
+    """
+
+    snapshot_ext = ".json"
+
+    def __init__(self, base_path: str) -> None:
+        """
+        Initializes the index, loading it from disk if it was persisted.
+
+        Args:
+            base_path (str): Path of the index files, without extension.
+        """
+        self.snapshot_path = f"{base_path}{self.snapshot_ext}"
+        self.journal_path = f"{base_path}.jsonl"
+        self.lock_path = f"{base_path}.lock"
+        self.journal_size = 0
+        self._journal_offset = 0
+        self._snapshot_stat: tuple | None = None
+        self._thread_lock = threading.RLock()
+        self._locked = False
+        self._reset()
+        with self._synced():
+            pass
+
+    @abstractmethod
+    def _reset(self) -> None:
+        """Empties the in memory index."""
+
+    @abstractmethod
+    def _read_snapshot(self, path: str) -> None:
+        """Loads the snapshot into the empty index."""
+
+    @abstractmethod
+    def _write_snapshot(self, path: str) -> None:
+        """Writes the whole index to path."""
+
+    @abstractmethod
+    def _apply(self, entry: dict) -> None:
+        """Applies a journal entry to the index."""
+
+    def _changed(self) -> None:
+        """Called after the index changed, to drop the derived caches."""
+
+    @staticmethod
+    def _stat(path: str) -> tuple | None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def _synced(self) -> Iterator[None]:
+        """Holds the lock on the files, with the index up to date with them."""
+        with self._thread_lock:
+            if self._locked:
+                yield
+                return
+            with file_lock(self.lock_path):
+                self._locked = True
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    self._locked = False
+
+    def _sync(self) -> None:
+        snapshot_stat = self._stat(self.snapshot_path)
+        journal_stat = self._stat(self.journal_path)
+        journal_bytes = journal_stat[2] if journal_stat else 0
+        if snapshot_stat != self._snapshot_stat or journal_bytes < self._journal_offset:
+            self._reload(snapshot_stat)
+            self._changed()
+        elif journal_bytes > self._journal_offset:
+            self._replay()
+            self._changed()
+
+    def _reload(self, snapshot_stat: tuple | None) -> None:
+        self._reset()
+        self.journal_size = 0
+        self._journal_offset = 0
+        self._snapshot_stat = snapshot_stat
+        if snapshot_stat is not None:
+            try:
+                self._read_snapshot(self.snapshot_path)
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(
+                    f"Ignoring unreadable snapshot {self.snapshot_path}: {e}"
+                )
+                self._reset()
+        self._replay()
+
+    def _replay(self) -> None:
+        """Applies the journal entries appended since the last replay."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                self._journal_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut by a crash while appending
+                    logging.warning(f"Skipping corrupted entry of {self.journal_path}.")
+                    continue
+                self._apply(entry)
+                self.journal_size += 1
+
+    def _append(self, entry: dict) -> None:
+        """
+        Persists a change already applied to the index. Must be called within _synced.
+
+        Args:
+            entry (dict): The journal entry, as read back by _apply.
+        """
+        self._changed()
+        if self.journal_size + 1 >= COMPACT_EVERY:
+            self._compact()
+            return
+        line = json.dumps(entry) + "\n"
+        with open(self.journal_path, "ab") as f:
+            if f.tell() and not self._ends_with_newline():
+                # Terminate the line cut by a crash, it is skipped on replay
+                line = "\n" + line
+            f.write(line.encode("utf-8"))
+        self._journal_offset = self._stat(self.journal_path)[2]
+        self.journal_size += 1
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.journal_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _compact(self) -> None:
+        tmp_path = f"{self.snapshot_path}.tmp{self.snapshot_ext}"
+        self._write_snapshot(tmp_path)
+        os.replace(tmp_path, self.snapshot_path)
+        open(self.journal_path, "w", encoding="utf-8").close()
+        self._snapshot_stat = self._stat(self.snapshot_path)
+        self._journal_offset = 0
+        self.journal_size = 0
+
+    def compact(self) -> None:
+        """Writes the snapshot of the index and empties the journal."""
+        with self._synced():
+            self._compact()
@@ -0,0 +1,298 @@
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Iterable
+import numpy as np
+from src.journal import JournaledIndex
+
+# Dimension of the hashed term space, large enough for distinct words to
+# rarely share a feature. The vectors are sparse, so its size costs only the
+# document frequency and idf arrays.
+INDEX_DIM = 2**20
+# Stories changed since the inverted index was built, relative to the number
+# of stories, after which it is rebuilt with a fresh idf
+REBUILD_RATIO = 0.1
+
+_TOKEN_RE = re.compile(r"[^\W\d_]{3,}")
+
+
+def vectorize(text: str, dim: int = INDEX_DIM) -> dict[int, float]:
+    """
+    Returns the sparse term frequency vector of a text.
+
+    Words are hashed into dim features, with sublinear term frequency.
+
+    Args:
+        text (str): The text to vectorize.
+        dim (int): The number of features.
+
+    Returns:
+        dict[int, float]: The non zero features.
+    """
+    counts = Counter(
+        zlib.crc32(token.encode("utf-8")) % dim
+        for token in _TOKEN_RE.findall(text.lower())
+    )
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+class SimilarityIndex(JournaledIndex):
+    """
+    A TF-IDF vector index over the story contents, answering nearest neighbour
+    queries from an inverted index, reading only the postings of the terms of
+    the query.
+
+    The inverted index is kept as CSR arrays sorted by feature and is rebuilt
+    after REBUILD_RATIO of the stories changed. Until then the changed stories
+    are scored directly from their vectors.
+
+    The term frequencies are persisted by JournaledIndex.
+    """
+
+    snapshot_ext = ".npz"
+
+    def __init__(self, base_path: str, dim: int = INDEX_DIM) -> None:
+        """
+        Initializes the index, loading it from disk if it was persisted.
+
+        Args:
+            base_path (str): Path of the index files, without extension.
+            dim (int): The number of hashed features.
+        """
+        self.dim = dim
+        super().__init__(base_path)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def titles(self) -> list[str]:
+        return list(self.vectors)
+
+    def _reset(self) -> None:
+        self.vectors: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.df = np.zeros(self.dim, dtype=np.int32)
+        self._built_titles: list[str] = []
+        self._built_rows: dict[str, int] = {}
+        self._features = np.zeros(0, dtype=np.int32)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._idf = np.zeros(self.dim, dtype=np.float32)
+        self._stale: set[str] = set()
+
+    def _read_snapshot(self, path: str) -> None:
+        with np.load(path) as data:
+            if int(data["dim"]) != self.dim:
+                raise ValueError(f"features hashed into {int(data['dim'])} dimensions")
+            titles = [str(title) for title in data["titles"]]
+            indptr = data["indptr"]
+            features = data["features"]
+            tf = data["tf"]
+        for row, title in enumerate(titles):
+            start, end = indptr[row], indptr[row + 1]
+            self.vectors[title] = features[start:end], tf[start:end]
+        self.df += np.bincount(features, minlength=self.dim).astype(np.int32)
+        self._stale = set(titles)
+
+    def _write_snapshot(self, path: str) -> None:
+        vectors = list(self.vectors.values())
+        indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+        np.cumsum([len(features) for features, _ in vectors], out=indptr[1:])
+        np.savez(
+            path,
+            dim=self.dim,
+            titles=np.array(self.titles, dtype=str),
+            indptr=indptr,
+            features=np.concatenate([f for f, _ in vectors] or [np.zeros(0, np.int32)]),
+            tf=np.concatenate([tf for _, tf in vectors] or [np.zeros(0, np.float32)]),
+        )
+
+    def _apply(self, entry: dict) -> None:
+        if entry["op"] == "set":
+            features = {int(k): v for k, v in entry["features"].items()}
+            self._set(entry["title"], features)
+        elif entry["op"] == "remove":
+            self._remove(entry["title"])
+        elif entry["op"] == "rename":
+            self._rename(entry["old"], entry["new"])
+
+    def _log(self, entry: dict) -> None:
+        self._apply(entry)
+        self._append(entry)
+
+    def _set(self, title: str, features: dict[int, float]) -> None:
+        self._remove(title)
+        order = sorted(features)
+        vector = (
+            np.array(order, dtype=np.int32),
+            np.array([features[f] for f in order], dtype=np.float32),
+        )
+        self.vectors[title] = vector
+        self.df[vector[0]] += 1
+        self._stale.add(title)
+
+    def _remove(self, title: str) -> None:
+        vector = self.vectors.pop(title, None)
+        if vector is not None:
+            self.df[vector[0]] -= 1
+            self._stale.add(title)
+
+    def _rename(self, old: str, new: str) -> None:
+        if old not in self.vectors:
+            return
+        self._remove(new)
+        self.vectors[new] = self.vectors.pop(old)
+        self._stale.update((old, new))
+
+    def _weighted(self, vector: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """Returns the L2 normalized tf-idf weights of a vector."""
+        weights = vector[1] * self._idf[vector[0]]
+        norm = np.linalg.norm(weights)
+        return weights / norm if norm else weights
+
+    def _weighted_postings(
+        self, vectors: list[tuple[np.ndarray, np.ndarray]]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the features, rows and L2 normalized tf-idf weights of vectors."""
+        features = np.concatenate([f for f, _ in vectors])
+        rows = np.repeat(
+            np.arange(len(vectors), dtype=np.int32), [len(f) for f, _ in vectors]
+        )
+        weights = np.concatenate([tf for _, tf in vectors]) * self._idf[features]
+        norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=len(vectors)))
+        weights /= np.where(norms == 0, 1, norms)[rows]
+        return features, rows, weights
+
+    def _build(self) -> None:
+        """Builds the inverted index of the current vectors, with a fresh idf."""
+        n = len(self)
+        # Terms found in every story, like the template headings, weigh 0
+        self._idf = np.log((1 + n) / (1 + self.df)).astype(np.float32)
+        self._built_titles = self.titles
+        self._built_rows = {title: row for row, title in enumerate(self._built_titles)}
+        self._stale = set()
+        if not n:
+            return
+        features, rows, weights = self._weighted_postings(list(self.vectors.values()))
+        # Terms with zero weight match every story, they are left out
+        order = np.flatnonzero(weights)
+        order = order[np.argsort(features[order], kind="stable")]
+        self._features = features[order]
+        self._rows = rows[order]
+        self._weights = weights[order]
+
+    def add(self, title: str, text: str) -> None:
+        """
+        Adds or replaces the vector of a story.
+
+        Args:
+            title (str): The story title.
+            text (str): The story content.
+        """
+        features = vectorize(text, self.dim)
+        with self._synced():
+            self._log({"op": "set", "title": title, "features": features})
+
+    def remove(self, title: str) -> None:
+        """Removes a story from the index."""
+        with self._synced():
+            if title in self.vectors:
+                self._log({"op": "remove", "title": title})
+
+    def rename(self, old_title: str, new_title: str) -> None:
+        """Renames a story in the index, keeping its vector."""
+        with self._synced():
+            if old_title in self.vectors and old_title != new_title:
+                self._log({"op": "rename", "old": old_title, "new": new_title})
+
+    def clear(self) -> None:
+        """Removes all the stories from the index."""
+        self.rebuild([])
+
+    def rebuild(self, stories: Iterable[tuple[str, str]]) -> None:
+        """
+        Replaces the whole index with the given stories.
+
+        Args:
+            stories (Iterable[tuple[str, str]]): The title and content of each story.
+        """
+        with self._synced():
+            self._reset()
+            for title, text in stories:
+                self._set(title, vectorize(text, self.dim))
+            self._compact()
+
+    def query(self, title: str, k: int = 5) -> list[tuple[str, float]]:
+        """
+        Returns the stories most similar to the given one.
+
+        Args:
+            title (str): The title of the story.
+            k (int): The number of stories to return.
+
+        Returns:
+            list[tuple[str, float]]: The titles and the cosine similarities,
+            most similar first. Empty if the story is not indexed.
+        """
+        with self._synced():
+            return self._query(title, k)
+
+    def _query(self, title: str, k: int) -> list[tuple[str, float]]:
+        vector = self.vectors.get(title)
+        if vector is None or k <= 0:
+            return []
+        if len(self._stale) > REBUILD_RATIO * max(len(self._built_titles), 1):
+            self._build()
+        weights = self._weighted(vector)
+        nonzero = np.flatnonzero(weights)
+        features, weights = vector[0][nonzero], weights[nonzero]
+        if not len(features):
+            return []
+
+        # Gather the postings of the query terms from the sorted CSR arrays
+        start = np.searchsorted(self._features, features, side="left")
+        counts = np.searchsorted(self._features, features, side="right") - start
+        postings = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(
+            counts.sum()
+        )
+        scores = np.bincount(
+            self._rows[postings],
+            weights=self._weights[postings] * np.repeat(weights, counts),
+            minlength=len(self._built_titles),
+        )
+        # The changed stories are scored from their current vectors instead
+        changed = self._stale | {title}
+        scores[
+            [self._built_rows[t] for t in changed if t in self._built_rows]
+        ] = -np.inf
+        results = [
+            (self._built_titles[row], float(scores[row]))
+            for row in self._top(scores, k)
+        ]
+        others = [other for other in changed - {title} if other in self.vectors]
+        if others:
+            other_features, other_rows, other_weights = self._weighted_postings(
+                [self.vectors[other] for other in others]
+            )
+            position = np.minimum(
+                np.searchsorted(features, other_features), len(features) - 1
+            )
+            match = features[position] == other_features
+            other_scores = np.bincount(
+                other_rows[match],
+                weights=other_weights[match] * weights[position[match]],
+                minlength=len(others),
+            )
+            results += zip(others, other_scores.tolist())
+        results.sort(key=lambda result: -result[1])
+        return [(other, score) for other, score in results[:k] if score > 0]
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Returns the rows of the k highest scores."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Returns a stable hash of the given JSON serializable parts.
+
+    Args:
+        *parts (Any): The values identifying a call.
+
+    Returns:
+        str: The SHA-256 hex digest of the parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is running,
+    the other calls for the same key wait for it and share its result,
+    instead of running again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs fn, unless a call with the same key is running already.
+
+        Args:
+            key (str): The key identifying identical calls.
+            fn (Callable): The function to run.
+            *args: The positional arguments of fn.
+            **kwargs: The keyword arguments of fn.
+
+        Returns:
+            Any: The result of fn, or of the running call with the same key.
+
+        Raises:
+            Exception: The exception raised by fn, in every caller sharing it.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            logging.info(f"Joining the running call {key[:12]}.")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
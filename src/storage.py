@@ -1,9 +1,53 @@
 from typing import List, Any
+import functools
 import os
+import threading
 from tinydb import TinyDB, Query
+from src.depgraph import (
+    DependencyGraph,
+    DependencyPlan,
+    dependencies_section,
+    replace_reference,
+)
+from src.journal import file_lock
+from src.similarity import SimilarityIndex
 
 DB_FILE = "stories_db.json"
+# Lock file serializing the processes sharing the DB
+DB_LOCK_FILE = "stories_db.lock"
 STORIES_DIR = "stories"
+# Base name of the similarity index files, stored next to the DB
+INDEX_FILE = "stories_index"
+# Base name of the dependency graph files, stored next to the DB
+GRAPH_FILE = "stories_graph"
+# Environment variable overriding the directory holding the DB and the stories
+DATA_DIR_ENV = "AI_AGILE_DEV_DATA_DIR"
+
+
+def _synchronized(method):
+    """
+    Serializes the calls to the storage, across the threads and across the
+    processes sharing the data directory, like the UI and the API containers.
+    TinyDB is not thread safe and rewrites the whole file on every operation.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            if self._locked:
+                return method(self, *args, **kwargs)
+            with file_lock(self.lock_path):
+                self._locked = True
+                try:
+                    # Another process may have written the DB since, drop the
+                    # query results and the next document id cached by TinyDB
+                    self.db.close()
+                    self.db = TinyDB(self.db_path)
+                    return method(self, *args, **kwargs)
+                finally:
+                    self._locked = False
+
+    return wrapper
 
 
 class _Storage:
@@ -17,15 +61,30 @@ class _Storage:
         Initializes the storage, setting up paths and the database connection.
         """
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.db_path = os.path.join(project_root, DB_FILE)
-        self.stories_dir = os.path.join(project_root, STORIES_DIR)
+        data_dir = os.environ.get(DATA_DIR_ENV, project_root)
+        self.db_path = os.path.join(data_dir, DB_FILE)
+        self.lock_path = os.path.join(data_dir, DB_LOCK_FILE)
+        self.stories_dir = os.path.join(data_dir, STORIES_DIR)
 
         # Ensure stories directory exists
         os.makedirs(self.stories_dir, exist_ok=True)
 
-        # Initialize TinyDB instance
+        # Initialize TinyDB instance, shared by all the sessions of the process
         self.db = TinyDB(self.db_path)
+        self._lock = threading.RLock()
+        self._locked = False
 
+        # Initialize the similarity index, rebuilding it if it is out of sync
+        self.index = SimilarityIndex(os.path.join(data_dir, INDEX_FILE))
+        if set(self.index.titles) != set(self.get_story_titles()):
+            self.rebuild_index()
+
+        # Initialize the dependency graph, rebuilding it if it is out of sync
+        self.graph = DependencyGraph(os.path.join(data_dir, GRAPH_FILE))
+        if set(self.graph.titles) != set(self.get_story_titles()):
+            self.rebuild_graph()
+
+    @_synchronized
     def save_story(self, story: Any) -> None:
         """
         Saves a user story as a markdown file and stores its metadata.
@@ -41,7 +100,10 @@ class _Storage:
 
         # Save metadata to TinyDB
         self.db.insert({"title": story.Title, "file": filename})
+        self.index.add(story.Title, story.to_template_string())
+        self.graph.set(story.Title, story.Dependencies)
 
+    @_synchronized
     def save_problem_description(self, description: str) -> None:
         """
         Saves or updates the original problem description in the database.
@@ -55,6 +117,7 @@ class _Storage:
             Problem.type == "problem_description",
         )
 
+    @_synchronized
     def get_problem_description(self) -> str | None:
         """
         Retrieves the original problem description from the database.
@@ -68,6 +131,7 @@ class _Storage:
             return result[0]["content"]
         return None
 
+    @_synchronized
     def get_story_titles(self) -> List[str]:
         """
         Returns a list of all story titles stored in the database.
@@ -79,6 +143,7 @@ class _Storage:
         # This implicitly filters out other document types like 'problem_description'.
         return [entry["title"] for entry in self.db.all() if "title" in entry]
 
+    @_synchronized
     def get_story_by_title(self, title: str) -> str | None:
         """
         Retrieves a story by its title.
@@ -101,6 +166,7 @@ class _Storage:
         except FileNotFoundError:
             return None
 
+    @_synchronized
     def remove_story_by_title(self, title: str) -> bool:
         """
         Removes a story by its title, deleting both the markdown file and the database entry.
@@ -123,8 +189,11 @@ class _Storage:
 
         # Remove the entry from the database
         self.db.remove(Story.title == title)
+        self.index.remove(title)
+        self.graph.remove(title)
         return True
 
+    @_synchronized
     def remove_all_story(self) -> None:
         """
         Removes all stories from markdown files and the database.
@@ -141,7 +210,10 @@ class _Storage:
 
         # Remove all story entries from the database
         self.db.remove(Story.title.exists())
+        self.index.clear()
+        self.graph.clear()
 
+    @_synchronized
     def edit_story(self, title: str, new_content: str) -> bool:
         """
         Edits an existing story by its title, updating the markdown file content.
@@ -163,9 +235,12 @@ class _Storage:
         if os.path.exists(filepath):
             with open(filepath, "w", encoding="utf-8") as f:
                 f.write(new_content)
+            self.index.add(title, new_content)
+            self.graph.set(title, dependencies_section(new_content))
             return True
         return False
 
+    @_synchronized
     def rename_story(self, old_title: str, new_title: str) -> bool:
         """
         Renames an existing story by updating its title in the database and renaming the markdown file.
@@ -193,8 +268,78 @@ class _Storage:
         self.db.update(
             {"title": new_title, "file": new_filename}, Story.title == old_title
         )
+        self.index.rename(old_title, new_title)
+
+        # Update the references of the stories depending on the renamed one
+        dependents = self.graph.dependents(old_title)
+        self.graph.rename(old_title, new_title)
+        for dependent in dependents:
+            content = self.get_story_by_title(dependent)
+            if content is not None and dependent != new_title:
+                self.edit_story(
+                    dependent, replace_reference(content, old_title, new_title)
+                )
         return True
 
+    @_synchronized
+    def get_related_stories(self, title: str, k: int = 5) -> list[tuple[str, float]]:
+        """
+        Returns the stories with the most similar content to the given one.
+
+        Args:
+            title (str): The title of the story.
+            k (int): The maximum number of stories to return.
+
+        Returns:
+            list[tuple[str, float]]: The titles and similarity scores, most similar first.
+        """
+        return self.index.query(title, k)
+
+    @_synchronized
+    def rebuild_index(self) -> None:
+        """
+        Rebuilds the similarity index from the story files.
+        """
+        self.index.rebuild(
+            (title, self.get_story_by_title(title) or "")
+            for title in self.get_story_titles()
+        )
+
+    @_synchronized
+    def get_story_dependencies(self, title: str) -> tuple[list[str], list[str]]:
+        """
+        Returns the dependency context of a story.
+
+        Args:
+            title (str): The title of the story.
+
+        Returns:
+            tuple[list[str], list[str]]: The stories it depends on and the
+            stories depending on it.
+        """
+        return self.graph.dependencies(title), self.graph.dependents(title)
+
+    @_synchronized
+    def get_dependency_plan(self) -> DependencyPlan:
+        """
+        Returns the stories in dependency order.
+
+        Returns:
+            DependencyPlan: The topological order, the batches of independent
+            stories, the critical path and the stories in a dependency cycle.
+        """
+        return self.graph.plan()
+
+    @_synchronized
+    def rebuild_graph(self) -> None:
+        """
+        Rebuilds the dependency graph from the story files.
+        """
+        self.graph.rebuild(
+            (title, dependencies_section(self.get_story_by_title(title) or ""))
+            for title in self.get_story_titles()
+        )
+
 
 # Singleton instance of the storage manager
 _storage = _Storage()
@@ -210,3 +355,6 @@ remove_story_by_title = _storage.remove_story_by_title
 remove_all_story = _storage.remove_all_story
 edit_story = _storage.edit_story
 rename_story = _storage.rename_story
+get_related_stories = _storage.get_related_stories
+get_story_dependencies = _storage.get_story_dependencies
+get_dependency_plan = _storage.get_dependency_plan
@@ -9,7 +9,9 @@ from src.config import (
 from src.agent import create_stories
 from src.storage import (
     edit_story,
+    get_related_stories,
     get_story_by_title,
+    get_story_dependencies,
     remove_story_by_title,
     remove_all_story,
     get_story_titles,
@@ -131,6 +133,36 @@ def render_story_view_mode(title: str, content: str):
             st.success(f"Story '{title}' removed.")
             st.session_state.selected_story = None
             st.rerun()
+    render_story_dependencies(title)
+    render_related_stories(title)
+
+
+def render_story_dependencies(title: str):
+    """Renders the stories the given one depends on and the ones depending on it."""
+    depends_on, required_by = get_story_dependencies(title)
+    for header, key, titles in [
+        ("Depends on", "depends", depends_on),
+        ("Required by", "required", required_by),
+    ]:
+        if not titles:
+            continue
+        st.subheader(header)
+        for dep_title in titles:
+            if st.button(dep_title, key=f"{key}_{dep_title}"):
+                st.session_state.selected_story = dep_title
+                st.rerun()
+
+
+def render_related_stories(title: str):
+    """Renders the stories related to the given one, to navigate to them."""
+    related = get_related_stories(title)
+    if not related:
+        return
+    st.subheader("Related stories")
+    for related_title, score in related:
+        if st.button(f"{related_title} ({score:.0%})", key=f"related_{related_title}"):
+            st.session_state.selected_story = related_title
+            st.rerun()
 
 
 def render_story_edit_mode(title: str, content: str):
@@ -200,6 +232,9 @@ def render_create_page():
         st.text_area("Documentation Content", doc_content, height=300)
 
     minimal = st.checkbox("Only extract minimal user story names without details")
+    pipelined = st.checkbox(
+        "Refine each story as soon as it is extracted", disabled=minimal
+    )
 
     if st.button("Create"):
         if uploaded_file and st.session_state.model:
@@ -209,6 +244,7 @@ def render_create_page():
                     st.session_state.model,
                     doc_content,
                     minimal,
+                    pipelined,
                 )
             st.success("Stories created successfully.")
             st.rerun()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the tests away from the real stories DB, before src.storage is imported
+os.environ.setdefault("AI_AGILE_DEV_DATA_DIR", tempfile.mkdtemp())
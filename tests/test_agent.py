@@ -0,0 +1,42 @@
+import pytest
+from src import agent
+from src.config import OllamaModel, PipelineStage
+
+
+@pytest.fixture
+def model_names(monkeypatch):
+    monkeypatch.setattr(
+        agent, "get_chat_model", lambda provider, model: f"{provider}:{model}"
+    )
+
+
+def test_each_stage_gets_its_own_model(model_names):
+    state = agent.get_initial_state(
+        "google_genai",
+        "gemini-2.5-flash-lite",
+        "Users log in.",
+        stage_models={
+            PipelineStage.CLEAN: f"ollama:{OllamaModel.GEMMA_3_8B.value}",
+            PipelineStage.REFINE: "google_genai:gemini-2.5-pro",
+        },
+        cascade_model="google_genai:gemini-2.5-flash",
+    )
+    assert state["llms"] == {
+        PipelineStage.CLEAN: "ollama:gemma-3:8b",
+        PipelineStage.EXTRACT: "google_genai:gemini-2.5-flash-lite",
+        PipelineStage.REFINE: "google_genai:gemini-2.5-pro",
+    }
+    assert state["fallback_llm"] == "google_genai:gemini-2.5-flash"
+
+
+def test_stages_default_to_the_main_model(model_names):
+    state = agent.get_initial_state("ollama", "qwen-3:8b", "Users log in.")
+    assert set(state["llms"].values()) == {"ollama:qwen-3:8b"}
+    assert state["fallback_llm"] is None
+
+
+def test_chat_models_are_pooled_and_checked():
+    llm = agent.get_chat_model("ollama", OllamaModel.QWEN_3_8B.value)
+    assert agent.get_chat_model("ollama", OllamaModel.QWEN_3_8B.value) is llm
+    with pytest.raises(ValueError, match="Unknown provider"):
+        agent.get_chat_model("fake", "model")
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from src import api
+from src.api import app
+from src.genai import UserStory
+from src.storage import remove_all_story, save_story
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    remove_all_story()
+    monkeypatch.setattr(api, "_jobs", api._Jobs())
+
+
+@pytest.fixture
+def stories():
+    for title in ["Login", "Export reports"]:
+        save_story(UserStory(Title=title, Description="d", AcceptanceCriteria="- c"))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_story_crud(stories):
+    assert sorted(client.get("/stories").json()) == ["Export reports", "Login"]
+    assert "# Login" in client.get("/stories/Login").json()["content"]
+
+    response = client.put("/stories/Login", json={"content": "# Login\nNew"})
+    assert response.status_code == 200
+    assert client.get("/stories/Login").json()["content"] == "# Login\nNew"
+
+    response = client.post("/stories/Login/rename", json={"new_title": "Sign in"})
+    assert response.json() == {"title": "Sign in"}
+    assert client.get("/stories/Login").status_code == 404
+    assert client.get("/stories/Sign in").json()["content"] == "# Login\nNew"
+
+    assert client.delete("/stories/Sign in").status_code == 204
+    assert client.get("/stories").json() == ["Export reports"]
+    assert client.delete("/stories").status_code == 204
+    assert client.get("/stories").json() == []
+
+
+def test_missing_story_is_404():
+    assert client.get("/stories/Login").status_code == 404
+    assert client.put("/stories/Login", json={"content": "x"}).status_code == 404
+    response = client.post("/stories/Login/rename", json={"new_title": "Sign in"})
+    assert response.status_code == 404
+    assert client.delete("/stories/Login").status_code == 404
+
+
+def test_rename_to_an_existing_title_is_409(stories):
+    response = client.post(
+        "/stories/Login/rename", json={"new_title": "Export reports"}
+    )
+    assert response.status_code == 409
+    assert sorted(client.get("/stories").json()) == ["Export reports", "Login"]
+
+
+def test_job_runs_to_done(monkeypatch):
+    calls = []
+
+    def create_stories(provider, model, document, minimal, *args):
+        calls.append((provider, model, document, minimal))
+        return [UserStory(Title=document, Description="d", AcceptanceCriteria="- c")]
+
+    monkeypatch.setattr(api, "create_stories", create_stories)
+    response = client.post(
+        "/jobs", json={"documents": ["Login"], "provider": "ollama", "model": "m"}
+    )
+    assert response.status_code == 202
+    job_id = response.json()[0]["id"]
+
+    wait_for(lambda: client.get(f"/jobs/{job_id}").json()["status"] == "done")
+    job = client.get(f"/jobs/{job_id}").json()
+    assert [story["Title"] for story in job["stories"]] == ["Login"]
+    assert job["started_at"] and job["finished_at"]
+    assert calls == [("ollama", "m", "Login", False)]
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_too_many_pending_jobs_is_429(monkeypatch):
+    release = threading.Event()
+
+    def create_stories(*args):
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(api, "create_stories", create_stories)
+    monkeypatch.setattr(api, "MAX_PENDING_JOBS", 3)
+    try:
+        response = client.post("/jobs", json={"documents": ["a", "b"]})
+        assert response.status_code == 202
+        response = client.post("/jobs", json={"documents": ["c", "d"]})
+        assert response.status_code == 429
+        assert len(client.get("/jobs").json()) == 2
+        assert client.post("/jobs", json={"documents": ["c"]}).status_code == 202
+    finally:
+        release.set()
+    wait_for(lambda: all(job["status"] == "done" for job in client.get("/jobs").json()))
+    assert client.post("/jobs", json={"documents": ["d"]}).status_code == 202
+
+
+def test_requests_over_the_limit_are_503(monkeypatch):
+    entered = threading.Event()
+    release = threading.Event()
+
+    def get_story_titles():
+        entered.set()
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(api, "get_story_titles", get_story_titles)
+    monkeypatch.setattr(api, "_request_slots", asyncio.Semaphore(1))
+    responses = []
+    slow = threading.Thread(target=lambda: responses.append(client.get("/stories")))
+    slow.start()
+    try:
+        assert entered.wait(5)
+        response = client.get("/jobs")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+        slow.join(5)
+    assert responses[0].status_code == 200
+    assert client.get("/jobs").status_code == 200
+
+
+def test_post_jobs_rejects_invalid_stage_model():
+    response = client.post(
+        "/jobs",
+        json={"documents": ["Users log in."], "stage_models": {"refine": "bad"}},
+    )
+    assert response.status_code == 422
+    assert client.get("/jobs").json() == []
+
+
+def test_post_jobs_rejects_invalid_cascade_model():
+    response = client.post(
+        "/jobs", json={"documents": ["Users log in."], "cascade_model": ":pro"}
+    )
+    assert response.status_code == 422
+
+
+def test_post_jobs_rejects_unknown_provider():
+    for request in [
+        {"provider": "fake"},
+        {"stage_models": {"extract": "fake:model"}},
+        {"cascade_model": "fake:model"},
+    ]:
+        response = client.post("/jobs", json={"documents": ["d"], **request})
+        assert response.status_code == 422
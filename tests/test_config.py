@@ -0,0 +1,27 @@
+import pytest
+from src.config import get_model_cost, parse_model_spec
+
+
+def test_cost_of_a_priced_model():
+    assert get_model_cost("gemini-2.5-flash", 1_000_000, 1_000_000) == pytest.approx(
+        2.80
+    )
+    assert get_model_cost("gemini-2.5-pro", 2_000, 0) == pytest.approx(0.0025)
+
+
+def test_cost_strips_the_models_prefix():
+    assert get_model_cost("models/gemini-2.5-flash-lite", 1_000_000, 0) == (
+        get_model_cost("gemini-2.5-flash-lite", 1_000_000, 0)
+    )
+    assert get_model_cost("models/gemini-2.5-flash-lite", 1_000_000, 0) > 0
+
+
+def test_unpriced_local_models_are_free():
+    assert get_model_cost("gemma-3:8b", 1_000_000, 1_000_000) == 0
+
+
+def test_parse_model_spec():
+    assert parse_model_spec("ollama:gemma-3:8b") == ("ollama", "gemma-3:8b")
+    for spec in ["ollama", ":gemma-3:8b", "fake:model"]:
+        with pytest.raises(ValueError):
+            parse_model_spec(spec)
@@ -0,0 +1,119 @@
+import pytest
+from src import journal
+from src.depgraph import (
+    DependencyGraph,
+    critical_path,
+    replace_reference,
+    resolve_references,
+    topological_batches,
+)
+from src.genai import UserStory
+
+
+@pytest.fixture
+def base_path(tmp_path):
+    return str(tmp_path / "stories_graph")
+
+
+@pytest.fixture
+def graph(base_path):
+    graph = DependencyGraph(base_path)
+    graph.set("Login", "")
+    graph.set("Reset password", "Login")
+    graph.set("Export reports", "- Login\n- Reset password")
+    return graph
+
+
+def test_resolves_only_whole_list_items():
+    titles = ["Login", "Export reports", "Search, filter and sort"]
+    assert resolve_references("login, Export  Reports.", titles) == {
+        "Login",
+        "Export reports",
+    }
+    assert resolve_references("1. Search, filter and sort", titles) == {
+        "Search, filter and sort"
+    }
+    assert resolve_references("Users must login before they export", titles) == set()
+
+
+def test_set_remove_and_dependents(graph):
+    assert graph.dependencies("Export reports") == ["Login", "Reset password"]
+    assert graph.dependents("Login") == ["Export reports", "Reset password"]
+    graph.remove("Reset password")
+    assert graph.dependencies("Export reports") == ["Login"]
+    assert graph.dependents("Login") == ["Export reports"]
+
+
+def test_new_title_resolves_the_stories_listing_it(graph):
+    graph.set("Share reports", "Export reports, Audit log")
+    assert graph.dependencies("Share reports") == ["Export reports"]
+    graph.set("Audit log", "")
+    assert graph.dependencies("Share reports") == ["Audit log", "Export reports"]
+
+
+def test_prose_does_not_create_edges(base_path):
+    graph = DependencyGraph(base_path)
+    graph.set("Search", "")
+    graph.set("Export reports", "Export needs the search results to be fast.")
+    graph.set("Login", "")
+    assert graph.dependencies("Export reports") == []
+
+
+def test_rename_rewrites_only_the_list_items(graph):
+    graph.set("Audit log", "Login\nAuditors login to read the log.")
+    graph.rename("Login", "Sign in")
+    assert graph.dependents("Sign in") == [
+        "Audit log",
+        "Export reports",
+        "Reset password",
+    ]
+    assert graph.texts["Export reports"] == "- Sign in\n- Reset password"
+    assert graph.texts["Audit log"] == "Sign in\nAuditors login to read the log."
+
+
+def test_replace_reference_leaves_prose_as_written():
+    story = UserStory(
+        Title="Audit log",
+        Description="Admins login to read the audit log.",
+        AcceptanceCriteria="- Login is required.",
+        Dependencies="Login, Export reports",
+    )
+    content = replace_reference(story.to_template_string(), "Login", "Sign in")
+    expected = story.model_copy(update={"Dependencies": "Sign in, Export reports"})
+    assert content == expected.to_template_string()
+
+
+def test_reload_from_the_journal_and_the_snapshot(graph, base_path, monkeypatch):
+    graph.rename("Reset password", "Recover account")
+    assert DependencyGraph(base_path).requires == graph.requires
+    monkeypatch.setattr(journal, "COMPACT_EVERY", 1)
+    graph.set("Audit log", "Login")
+    assert graph.journal_size == 0
+    reloaded = DependencyGraph(base_path)
+    assert reloaded.requires == graph.requires
+    assert reloaded.texts == graph.texts
+
+
+def test_sees_the_changes_of_another_instance(graph, base_path):
+    other = DependencyGraph(base_path)
+    other.set("Audit log", "Export reports")
+    assert graph.dependents("Export reports") == ["Audit log"]
+    assert graph.plan()["critical_path"][-1] == "Audit log"
+
+
+def test_plan_orders_the_stories_and_leaves_out_cycles(graph):
+    graph.set("A", "B")
+    graph.set("B", "A")
+    plan = graph.plan()
+    assert plan["batches"] == [["Login"], ["Reset password"], ["Export reports"]]
+    assert plan["critical_path"] == ["Login", "Reset password", "Export reports"]
+    assert plan["cyclic"] == ["A", "B"]
+
+
+def test_critical_path_is_the_longest_chain():
+    requires = {"a": set(), "b": {"a"}, "c": {"b"}, "d": {"a"}, "e": {"d", "c"}}
+    batches, cyclic = topological_batches(requires)
+    assert batches == [["a"], ["b", "d"], ["c"], ["e"]]
+    assert cyclic == []
+    order = [title for batch in batches for title in batch]
+    assert critical_path(requires, order) == ["a", "b", "c", "e"]
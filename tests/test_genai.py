@@ -0,0 +1,228 @@
+import threading
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from src.fake_llm import FakeStoryChatModel
+from src.genai import (
+    UserStoriesMinimal,
+    UserStory,
+    UserStoryMinimal,
+    _ListItemScanner,
+    _find_json,
+    _load_json,
+    _parse_with_repair,
+    refine_story,
+    repair_structured_output,
+    stream_stories_minimal,
+    track_structured_output_stats,
+)
+
+STORY = '{"Title": "Login", "Description": "Users log in.", "AcceptanceCriteria": "- Works."}'
+
+
+def test_repair_strips_prose_and_fences():
+    for text in [
+        f"Sure! Here is the result:\n{STORY}\nLet me know if you need more.",
+        f"```json\n{STORY}\n```\nThe JSON above matches the schema.",
+    ]:
+        story = repair_structured_output(text, UserStory)
+        assert story.Title == "Login"
+        assert story.AcceptanceCriteria == "- Works."
+
+
+def test_repair_matches_key_casing():
+    text = '{"title": "Login", "description": "d", "acceptance_criteria": "c"}'
+    story = repair_structured_output(AIMessage(content=text), UserStory)
+    assert story == UserStory(Title="Login", Description="d", AcceptanceCriteria="c")
+
+
+def test_repair_skips_brackets_in_prose():
+    assert _load_json('Here {not json} then {"a": [1, 2]} done') == {"a": [1, 2]}
+
+
+def test_repair_rejects_truncated_string():
+    text = '{"Title": "A", "Description": "b", "AcceptanceCriteria": "- Given a us'
+    assert repair_structured_output(text, UserStory) is None
+
+
+def test_repair_drops_cut_off_list_item():
+    text = (
+        '{"Stories": [{"Title": "A", "Description": "a"}, '
+        '{"Title": "B", "Description": "Users can log in with'
+    )
+    result = repair_structured_output(text, UserStoriesMinimal)
+    assert [story.Title for story in result.Stories] == ["A"]
+
+
+def test_repair_drops_last_list_item_when_truncated():
+    text = (
+        '{"Stories": [{"Title": "A", "Description": "a"}, '
+        '{"Title": "B", "Description": "b"}'
+    )
+    result = repair_structured_output(text, UserStoriesMinimal)
+    assert [story.Title for story in result.Stories] == ["A"]
+
+
+def test_repair_rejects_truncated_list_without_complete_item():
+    text = '{"Stories": [{"Title": "A", "Description": "a"}'
+    assert repair_structured_output(text, UserStoriesMinimal) is None
+
+
+def test_repair_rejects_truncated_list_of_text_field():
+    text = '{"Title": "x", "Description": "d", "AcceptanceCriteria": ["a", "b'
+    assert repair_structured_output(text, UserStory) is None
+
+
+def test_repair_skips_unclosed_brackets_in_prose():
+    text = 'Stories [v1:\n{"Stories": [{"Title": "A", "Description": "x"}]}'
+    assert _find_json(text) == (
+        {"Stories": [{"Title": "A", "Description": "x"}]},
+        False,
+    )
+    result = repair_structured_output(text, UserStoriesMinimal)
+    assert [story.Title for story in result.Stories] == ["A"]
+
+
+def test_repair_splits_dependencies_text():
+    text = '[{"Title": "A", "Description": "a", "Dependencies": "B, C"}]'
+    result = repair_structured_output(text, UserStoriesMinimal)
+    assert result.Stories[0].Dependencies == ["B", "C"]
+
+
+def test_truncated_answer_accepted_by_the_parser_is_retried():
+    class TruncatingModel(FakeStoryChatModel):
+        answers: list = []
+
+        def _respond(self, messages):
+            return self.answers.pop(0)
+
+    llm = TruncatingModel(
+        first_token_latency=0,
+        chunk_latency=0,
+        answers=[STORY[:-5], STORY],
+    )
+    prompt = [HumanMessage(content="User Story Title: Login")]
+    story = _parse_with_repair(llm, UserStory, prompt)
+    assert story.AcceptanceCriteria == "- Works."
+    assert llm.answers == []
+
+
+def test_parsed_answer_after_unclosed_prose_bracket_is_kept():
+    class ProseModel(FakeStoryChatModel):
+        answers: list = []
+
+        def _respond(self, messages):
+            return self.answers.pop(0)
+
+    llm = ProseModel(
+        first_token_latency=0,
+        chunk_latency=0,
+        answers=[f"Story [draft:\n{STORY}", STORY],
+    )
+    prompt = [HumanMessage(content="User Story Title: Login")]
+    with track_structured_output_stats() as stats:
+        story = _parse_with_repair(llm, UserStory, prompt)
+    assert story.Title == "Login"
+    assert stats["retried"] == 0
+    assert len(llm.answers) == 1
+
+
+def test_rejected_result_is_kept_when_the_escalation_fails():
+    class BrokenModel(FakeStoryChatModel):
+        def _respond(self, messages):
+            return "Sorry, I cannot help with that."
+
+    llm = FakeStoryChatModel(first_token_latency=0, chunk_latency=0, failure_rate=1)
+    fallback = BrokenModel(first_token_latency=0, chunk_latency=0)
+    story = UserStoryMinimal(Title="Login", Description="Users log in.")
+    with track_structured_output_stats() as stats:
+        refined = refine_story(llm, story, fallback)
+    assert refined.Title == "Login"
+    assert refined.AcceptanceCriteria == ""
+    assert stats["escalations"] == 1
+    assert stats["failed"] == 0
+
+
+def test_rejected_result_is_escalated():
+    llm = FakeStoryChatModel(first_token_latency=0, chunk_latency=0, failure_rate=1)
+    fallback = FakeStoryChatModel(first_token_latency=0, chunk_latency=0)
+    story = UserStoryMinimal(Title="Login", Description="Users log in.")
+    with track_structured_output_stats() as stats:
+        refined = refine_story(llm, story, fallback)
+    assert refined.AcceptanceCriteria.strip()
+    assert stats["calls"] == 1
+    assert stats["escalations"] == 1
+
+
+def test_accepted_result_is_not_escalated():
+    llm = FakeStoryChatModel(first_token_latency=0, chunk_latency=0)
+    fallback = FakeStoryChatModel(
+        first_token_latency=0, chunk_latency=0, failure_rate=1
+    )
+    story = UserStoryMinimal(Title="Login", Description="Users log in.")
+    with track_structured_output_stats() as stats:
+        refined = refine_story(llm, story, fallback)
+    assert refined.AcceptanceCriteria.strip()
+    assert stats["escalations"] == 0
+
+
+def test_run_stats_count_only_the_calls_of_the_run():
+    llm = FakeStoryChatModel(first_token_latency=0.001, chunk_latency=0)
+    story = UserStoryMinimal(Title="Login", Description="Users log in.")
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def run(name: str, calls: int) -> None:
+        with track_structured_output_stats() as stats:
+            barrier.wait()
+            with ContextThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: refine_story(llm, story), range(calls)))
+        results[name] = stats["calls"]
+
+    threads = [
+        threading.Thread(target=run, args=("a", 3)),
+        threading.Thread(target=run, args=("b", 5)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": 3, "b": 5}
+
+
+def test_stream_escalation_counts_a_single_call():
+    llm = FakeStoryChatModel(first_token_latency=0, chunk_latency=0, failure_rate=1)
+    fallback = FakeStoryChatModel(first_token_latency=0, chunk_latency=0)
+    with track_structured_output_stats() as stats:
+        stories = list(stream_stories_minimal(llm, "Users log in.", fallback))
+    assert [story.Title for story in stories] == ["Users log in"]
+    assert stats["calls"] == 1
+    assert stats["escalations"] == 1
+
+
+def test_list_item_scanner_yields_each_item_when_it_closes():
+    scanner = _ListItemScanner()
+    assert (
+        scanner.feed('```json\n{"Stories": [{"Title": "A", "Description": "a ]}') == []
+    )
+    assert scanner.feed('"}, {"Title": "B",') == [{"Title": "A", "Description": "a ]}"}]
+    assert scanner.feed(' "Description": "b"}]}\n```') == [
+        {"Title": "B", "Description": "b"}
+    ]
+
+
+def test_stream_parses_the_whole_answer_when_not_a_streamable_list():
+    class WrappingModel(FakeStoryChatModel):
+        def _respond(self, messages):
+            return '{"result": {"Stories": [{"Title": "A", "Description": "a"}]}}'
+
+    llm = WrappingModel(first_token_latency=0, chunk_latency=0)
+    stories = list(stream_stories_minimal(llm, "Users log in."))
+    assert [story.Title for story in stories] == ["A"]
+
+
+def test_stream_without_valid_story_raises():
+    llm = FakeStoryChatModel(first_token_latency=0, chunk_latency=0, failure_rate=1)
+    with pytest.raises(OutputParserException):
+        list(stream_stories_minimal(llm, "Users log in."))
@@ -0,0 +1,103 @@
+import pytest
+from src import journal
+from src.similarity import SimilarityIndex
+
+STORIES = {
+    "Login": "Users log in with email and password to reach their dashboard.",
+    "Reset password": "Users reset a forgotten password through an email link.",
+    "Export reports": "Managers export the monthly sales reports as spreadsheets.",
+    "Share reports": "Managers share the sales reports with their team.",
+}
+
+
+@pytest.fixture
+def base_path(tmp_path):
+    return str(tmp_path / "stories_index")
+
+
+@pytest.fixture
+def index(base_path):
+    index = SimilarityIndex(base_path)
+    for title, text in STORIES.items():
+        index.add(title, text)
+    return index
+
+
+def titles(results):
+    return [title for title, _ in results]
+
+
+def test_query_returns_the_most_similar_stories(index):
+    assert titles(index.query("Export reports", k=1)) == ["Share reports"]
+    assert titles(index.query("Login", k=1)) == ["Reset password"]
+    assert index.query("Unknown") == []
+
+
+def test_remove_and_rename(index):
+    index.remove("Share reports")
+    assert "Share reports" not in titles(index.query("Export reports"))
+    index.rename("Reset password", "Recover account")
+    assert titles(index.query("Login", k=1)) == ["Recover account"]
+    assert sorted(index.titles) == ["Export reports", "Login", "Recover account"]
+
+
+def test_reload_matches_the_index(index, base_path):
+    index.remove("Share reports")
+    index.rename("Login", "Sign in")
+    index.add("Reset password", "Users reset a password from the sign in page.")
+    reloaded = SimilarityIndex(base_path)
+    assert reloaded.titles == index.titles
+    assert reloaded.query("Sign in") == index.query("Sign in")
+
+
+def test_reload_after_compaction(index, base_path, monkeypatch):
+    monkeypatch.setattr(journal, "COMPACT_EVERY", 3)
+    index.add("Delete account", "Users delete their account and data.")
+    index.remove("Login")
+    assert index.journal_size < 3
+    reloaded = SimilarityIndex(base_path)
+    assert sorted(reloaded.titles) == sorted(index.titles)
+    assert reloaded.query("Export reports") == index.query("Export reports")
+
+
+def test_sees_the_changes_of_another_instance(index, base_path):
+    other = SimilarityIndex(base_path)
+    other.add("Delete account", "Users delete their account and their password.")
+    other.remove("Share reports")
+    assert "Delete account" in titles(index.query("Login", k=10))
+    assert "Share reports" not in titles(index.query("Export reports"))
+    assert sorted(index.titles) == sorted(other.titles)
+
+
+def test_compaction_keeps_the_changes_of_another_instance(
+    index, base_path, monkeypatch
+):
+    # The fixture wrote 4 entries
+    monkeypatch.setattr(journal, "COMPACT_EVERY", 6)
+    other = SimilarityIndex(base_path)
+    other.add("Delete account", "Users delete their account.")
+    # Compacts, after catching up with the entry of the other instance
+    index.add("Audit log", "Admins read the audit log.")
+    assert index.journal_size == 0
+    expected = sorted([*STORIES, "Delete account", "Audit log"])
+    assert sorted(SimilarityIndex(base_path).titles) == expected
+    other.query("Login")
+    assert sorted(other.titles) == expected
+
+
+def test_changed_stories_are_scored_before_the_rebuild(index):
+    # Builds the inverted index, then changes fewer stories than REBUILD_RATIO
+    index.query("Login")
+    for i in range(20):
+        index.add(f"Story {i}", f"Topic {i} unrelated words.")
+    index.query("Login")
+    index.add("Share reports", "Users change their password from the dashboard.")
+    assert index._stale == {"Share reports"}
+    assert "Share reports" in titles(index.query("Login"))
+    index.remove("Reset password")
+    assert "Reset password" not in titles(index.query("Login"))
+
+
+def test_snapshot_of_another_dimension_is_ignored(index, base_path):
+    index.compact()
+    assert SimilarityIndex(base_path, dim=512).titles == []
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src import agent
+from src.config import PipelineStage
+from src.singleflight import SingleFlight, make_key
+
+CALLERS = 5
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def joined(caplog):
+    return sum("Joining the running call" in r.getMessage() for r in caplog.records)
+
+
+def call_concurrently(do, args_list):
+    """Runs do(*args) for each args at once, returns the futures in order."""
+    executor = ThreadPoolExecutor(max_workers=len(args_list))
+    futures = [executor.submit(do, *args) for args in args_list]
+    executor.shutdown(wait=False)
+    return futures
+
+
+@pytest.fixture(autouse=True)
+def info_logs(caplog):
+    caplog.set_level(logging.INFO)
+
+
+def test_identical_calls_run_once_and_share_the_result(caplog):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        release.wait(5)
+        return [value]
+
+    futures = call_concurrently(flight.do, [("key", fn, "a")] * CALLERS)
+    wait_for(lambda: joined(caplog) == CALLERS - 1)
+    release.set()
+    results = [future.result(timeout=5) for future in futures]
+    assert calls == ["a"]
+    assert all(result is results[0] for result in results)
+
+
+def test_the_exception_reaches_every_caller(caplog):
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError("model unavailable")
+
+    futures = call_concurrently(flight.do, [("key", fn)] * CALLERS)
+    wait_for(lambda: joined(caplog) == CALLERS - 1)
+    release.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            future.result(timeout=5)
+
+
+def test_the_key_is_freed_after_the_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("first call fails")
+        return len(calls)
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", fn)
+    assert flight.do("key", fn) == 2
+    assert flight.do("key", fn) == 3
+
+
+def test_make_key_is_stable():
+    assert make_key("text", {"b": 1, "a": 2}) == make_key("text", {"a": 2, "b": 1})
+    assert make_key("text", True) != make_key("text", False)
+
+
+def test_create_stories_coalesces_only_identical_calls(caplog, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def create(
+        provider, model, problem_text, minimal, pipelined, stage_models, cascade
+    ):
+        calls.append((minimal, stage_models))
+        release.wait(5)
+        return [problem_text]
+
+    monkeypatch.setattr(agent, "_create_stories", create)
+    stage_models = {PipelineStage.REFINE: "ollama:llama3.1"}
+    args_list = [
+        *[("ollama", "llama3.1", "doc", False)] * CALLERS,
+        ("ollama", "llama3.1", "doc", True),
+        ("ollama", "llama3.1", "doc", False, False, stage_models),
+    ]
+    futures = call_concurrently(agent.create_stories, args_list)
+    wait_for(lambda: len(calls) == 3 and joined(caplog) == CALLERS - 1)
+    release.set()
+    assert all(future.result(timeout=5) == ["doc"] for future in futures)
+    assert sorted(calls, key=str) == sorted(
+        [(False, None), (True, None), (False, stage_models)], key=str
+    )
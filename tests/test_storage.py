@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+from src.depgraph import DependencyGraph
+from src.similarity import SimilarityIndex
+from src.storage import DATA_DIR_ENV, DB_FILE, GRAPH_FILE, INDEX_FILE
+
+SAVE_STORIES = """
+import sys
+from src import storage
+from src.genai import UserStory
+
+for i in range(int(sys.argv[2])):
+    storage.save_story(
+        UserStory(Title=f"{sys.argv[1]} {i}", Description="d", AcceptanceCriteria="- c")
+    )
+"""
+
+
+def test_processes_sharing_the_db_lose_no_story(tmp_path):
+    env = {**os.environ, DATA_DIR_ENV: str(tmp_path)}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", SAVE_STORIES, name, "40"], cwd=root, env=env
+        )
+        for name in ("UI", "API")
+    ]
+    assert [process.wait(timeout=120) for process in processes] == [0, 0]
+
+    expected = sorted(f"{name} {i}" for name in ("UI", "API") for i in range(40))
+    with open(tmp_path / DB_FILE, encoding="utf-8") as f:
+        documents = json.load(f)["_default"].values()
+    assert sorted(document["title"] for document in documents) == expected
+    assert len(os.listdir(tmp_path / "stories")) == len(expected)
+    assert sorted(SimilarityIndex(str(tmp_path / INDEX_FILE)).titles) == expected
+    assert sorted(DependencyGraph(str(tmp_path / GRAPH_FILE)).titles) == expected